@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+"""
+Parser benchmark on a local export.
+
+Usage: python benchmark.py <exported chat txt>
+"""
+import sys
+import time
+import tracemalloc
+from itertools import islice
+from timestamps import detect_format
+from reader import iter_lines
+from chatline import parse_chatlines
+from helper import chat_frame
+import schema
+
+
+def memory_per_message(chat_txt):
+    """
+    Memory retained by the parsed columns, per message, in bytes.
+    """
+    timestamp_format = detect_format(iter_lines(chat_txt))
+    # warm up, so lazily loaded module data isn't counted
+    parse_chatlines(islice(iter_lines(chat_txt), 1000), timestamp_format)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    message = parse_chatlines(iter_lines(chat_txt), timestamp_format)
+    elapsed = time.perf_counter() - start
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    n = len(message['timestamp'])
+    return {
+        'messages': n,
+        'seconds': elapsed,
+        'retained_bytes_per_message': retained / n,
+        'peak_bytes_per_message': peak / n,
+    }
+
+
+def chat_df_memory(chat_txt):
+    """
+    Bytes per chat_df column, before and after schema.compact.
+    """
+    timestamp_format = detect_format(iter_lines(chat_txt))
+    return schema.memory_report(chat_frame(parse_chatlines(iter_lines(chat_txt), timestamp_format)))
+
+
+if __name__ == '__main__':
+    with open(sys.argv[1], 'rb') as chat_txt:
+        for key, value in memory_per_message(chat_txt).items():
+            print(key, ':', value)
+        print()
+        print(chat_df_memory(chat_txt))
@@ -0,0 +1,117 @@
+# -*- coding: utf-8 -*-
+"""
+Chart data computed server-side, so the browser gets a few hundred rows
+per chart instead of every row behind it.
+
+Densities are evaluated here instead of with Vega-Lite's transform_density,
+and long series are downsampled with Largest-Triangle-Three-Buckets (LTTB)
+to about one point every PIXELS_PER_POINT pixels, which keeps the peaks and
+dips a line chart shows. Every chart is capped at MAX_ROWS rows.
+"""
+import os
+import numpy as np
+import pandas as pd
+
+# width of a full width chart in the centered layout
+CHART_WIDTH = 700
+# point marks are a few pixels wide, more points only overlap
+PIXELS_PER_POINT = 4
+# most rows of data sent to the browser per chart
+MAX_ROWS = int(os.environ.get('WA_VIZ_CHART_MAX_ROWS', 5000))
+
+
+def point_budget(width=CHART_WIDTH):
+    """
+    Number of points worth drawing in a chart width pixels wide.
+    """
+    return max(min(width // PIXELS_PER_POINT, MAX_ROWS), 3)
+
+
+def bandwidth(values):
+    """
+    Gaussian kernel bandwidth of Vega's transform_density: Scott's normal
+    reference rule, with the interquartile range when it is smaller than
+    the standard deviation.
+    """
+    deviation = values.std(ddof=1) if len(values) > 1 else 0.0
+    q1, q3 = np.percentile(values, [25, 75])
+    spread = min(deviation, (q3 - q1) / 1.34) or deviation or abs(q1) or 1.0
+    return 1.06 * spread * len(values) ** -0.2
+
+
+def density(frame, value, by, steps):
+    """
+    Gaussian kernel density of value for every by group, at steps points
+    over the extent of the group. Same columns as
+    transform_density(value, as_=[value, 'density'], groupby=[by]).
+    """
+    densities = []
+    for key, values in frame.groupby(by, sort=True)[value]:
+        values = values.dropna().to_numpy(dtype=np.float64)
+        if not len(values):
+            continue
+        grid = np.linspace(values.min(), values.max(), steps)
+        h = bandwidth(values)
+
+        z = (grid[:, None] - values[None, :]) / h
+        pdf = np.exp(-0.5 * z ** 2).sum(axis=1) / (len(values) * h * np.sqrt(2 * np.pi))
+        densities.append(pd.DataFrame({by: key, value: grid, 'density': pdf}))
+
+    return pd.concat(densities, ignore_index=True)
+
+
+def lttb(x, y, n_out):
+    """
+    Positions of the n_out points of the series (x, y) kept by LTTB. The
+    first and last points are kept, every bucket in between keeps the point
+    forming the largest triangle with the previous kept point and the
+    average of the next bucket. Also returns the start of each bucket.
+    """
+    n = len(x)
+    if n <= n_out or n_out < 3:
+        return np.arange(n), np.arange(n)
+
+    # n_out - 2 buckets over the points between the first and the last
+    edges = np.append(np.linspace(1, n - 1, n_out - 1).astype(np.int64), n)
+    kept = np.empty(n_out, dtype=np.int64)
+    kept[0], kept[-1] = 0, n - 1
+
+    for bucket in range(n_out - 2):
+        lo, hi = edges[bucket], edges[bucket + 1]
+        next_x = x[hi:edges[bucket + 2]].mean()
+        next_y = y[hi:edges[bucket + 2]].mean()
+        prev_x, prev_y = x[kept[bucket]], y[kept[bucket]]
+
+        area = np.abs((prev_x - next_x) * (y[lo:hi] - prev_y) - (prev_x - x[lo:hi]) * (next_y - prev_y))
+        kept[bucket + 1] = lo + np.argmax(area)
+
+    return kept, np.concatenate([[0], edges[:-1]])
+
+
+def downsample(frame, x, y, n_out):
+    """
+    Rows of frame kept by lttb on its x & y columns, with the sum and the
+    number of y values of the bucket each row stands for (bucket_sum and
+    bucket_cnt), so averages over the chart stay exact.
+    """
+    frame = frame.dropna(subset=[y]).reset_index(drop=True)
+    x_value = frame[x].to_numpy()
+    if np.issubdtype(x_value.dtype, np.datetime64):
+        x_value = x_value.astype('datetime64[ns]').astype(np.int64)
+    y_value = frame[y].to_numpy(dtype=np.float64)
+
+    kept, starts = lttb(x_value.astype(np.float64), y_value, n_out)
+    return frame.iloc[kept].assign(
+        bucket_sum=np.add.reduceat(y_value, starts) if len(frame) else y_value,
+        bucket_cnt=np.diff(np.append(starts, len(frame))),
+    ).reset_index(drop=True)
+
+
+def cap(frame, column):
+    """
+    The MAX_ROWS rows of frame with the largest column, all of them if it
+    fits.
+    """
+    if len(frame) <= MAX_ROWS:
+        return frame
+    return frame.nlargest(MAX_ROWS, column).reset_index(drop=True)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+"""
+On-disk cache of parsed chats.
+
+Parsed chat_df are stored as Parquet files named after a hash of the
+uploaded bytes and the parser version, so re-uploading the same export
+after a restart or redeploy loads it instead of parsing it again. The
+cache directory is capped in size, least recently used files go first.
+
+Next to them, small .blocks files index the cached chats by the line
+block hashes of their export (see ingest), so a newer export of a cached
+chat only has its new lines parsed.
+
+The cache is off unless WA_VIZ_CACHE_DIR is set, the app promises not to
+store any data by default.
+"""
+import hashlib
+import os
+import tempfile
+import pyarrow.parquet as pq
+import exploded
+
+# bump when the parsed chat_df changes, so older cache files are ignored
+PARSER_VERSION = 3
+
+CACHE_DIR = os.environ.get('WA_VIZ_CACHE_DIR')
+CACHE_MAX_BYTES = int(os.environ.get('WA_VIZ_CACHE_MAX_BYTES', 1024 ** 3))
+
+HASH_CHUNK_SIZE = 1 << 20
+
+
+def enabled():
+    return CACHE_DIR is not None
+
+
+def cache_key(chat_txt):
+    digest = hashlib.blake2b(digest_size=20)
+    chat_txt.seek(0)
+    for chunk in iter(lambda: chat_txt.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    chat_txt.seek(0)
+
+    return "{}-v{}".format(digest.hexdigest(), PARSER_VERSION)
+
+
+def cache_path(key):
+    return os.path.join(CACHE_DIR, key + '.parquet')
+
+
+def blocks_path(first_block):
+    return os.path.join(CACHE_DIR, first_block + '.blocks')
+
+
+def load_blocks(first_block):
+    """
+    Return the cache key and block hashes of the last cached export
+    starting with first_block, or (None, ()).
+    """
+    try:
+        with open(blocks_path(first_block)) as f:
+            key, *blocks = f.read().split()
+    except (OSError, ValueError):
+        return None, ()
+
+    return key, tuple(blocks)
+
+
+def store_blocks(blocks, key):
+    # exports shorter than a block have nothing to index
+    if not blocks:
+        return
+
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write("\n".join((key,) + tuple(blocks)))
+        os.replace(tmp_path, blocks_path(blocks[0]))
+    except OSError:
+        os.remove(tmp_path)
+
+
+def load(key):
+    """
+    Return the cached chat_df of key, or None.
+    """
+    path = cache_path(key)
+    try:
+        # keep emoji & domain as exploded columns
+        chat_df = pq.read_table(path).to_pandas(
+            types_mapper=exploded.types_mapper,
+            ignore_metadata=True,
+        )
+        # mark as recently used for eviction
+        os.utime(path)
+    except (OSError, ValueError):
+        return None
+
+    return chat_df
+
+
+def store(key, chat_df):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+
+    # write then rename, so a crash never leaves a half written file
+    fd, tmp_path = tempfile.mkstemp(dir=CACHE_DIR, suffix='.tmp')
+    os.close(fd)
+    try:
+        chat_df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, cache_path(key))
+    except (OSError, ValueError):
+        os.remove(tmp_path)
+        return
+
+    evict()
+
+
+def evict(max_bytes=CACHE_MAX_BYTES):
+    """
+    Remove least recently used files until the cache fits in max_bytes.
+    """
+    entries = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(('.parquet', '.blocks')):
+            stat = os.stat(os.path.join(CACHE_DIR, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, name in sorted(entries):
+        if total <= max_bytes:
+            break
+        os.remove(os.path.join(CACHE_DIR, name))
+        total -= size
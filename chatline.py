@@ -1,15 +1,48 @@
 # -*- coding: utf-8 -*-
-import re
+import sys
 from dateutil import parser
-import emoji
-import patterns
+from emojis import extract_emojis
+import urls
+import classifier
+import exploded
 
 # TODO: Classify attachment
 
+# Shared by every line without emoji/domain, instead of a new list per line
+EMPTY = ()
+
+# Features extracted from message bodies on demand, see parse_chatlines
+FEATURES = ('emoji', 'domain')
+
+
+class ParserState:
+    """
+    What a following (multiline) line needs to know about the line before it.
+    Replaces the previous_line reference, which kept every parsed line alive.
+    """
+    __slots__ = ('sender', 'timestamp')
+
+    def __init__(self):
+        self.sender = None
+        self.timestamp = None
+
+    def update(self, chatline):
+        self.sender = chatline.sender
+        self.timestamp = chatline.timestamp
+
+
 class Chatline:
 
-    def __init__(self, line="", previous_line=None, debug=False):
-        self.previous_line = previous_line
+    __slots__ = (
+        'state', 'timestamp_format', 'line_classifier', 'features', 'line', 'line_type', 'timestamp', 'sender', 'body',
+        'is_startingline', 'is_followingline', 'is_deleted_chat', 'emojis', 'domains',
+    )
+
+    def __init__(self, line="", state=None, timestamp_format=None, line_classifier=classifier.FULL, features=FEATURES, debug=False):
+        self.state = state
+        self.timestamp_format = timestamp_format
+        self.line_classifier = line_classifier
+        self.features = features
         self.line = line
         self.line_type = None # Chat/Event/Attachment
         self.timestamp = None
@@ -18,23 +51,18 @@ class Chatline:
         self.is_startingline = False
         self.is_followingline = False
         self.is_deleted_chat = False
-        self.words = []
-        self.emojis = []
-        self.domains = []
+        self.emojis = EMPTY
+        self.domains = EMPTY
 
         self.parse_line(line)
         if debug:
             print()
-            for i in self.__dict__:
-                print(i, ':',  self.__dict__[i])
+            for i in self.__slots__:
+                print(i, ':',  getattr(self, i))
             print("------")
 
     def replace_bad_character(self, line=""):
-        line = line.strip()
-        for x in patterns.BAD_CHARS:
-            line = line.replace(x, "")
-
-        return line
+        return classifier.clean_line(line)
 
     def is_starting_line(self, line=""):
         """
@@ -45,7 +73,7 @@ class Chatline:
         The Rule is:
         <datetime><separator><contact/phone number>
         """
-        match = re.match(re.compile(patterns.IS_STARTING_LINE, re.VERBOSE), line)
+        match = classifier.STARTING_LINE.match(line)
         if match:
             return match
 
@@ -59,7 +87,7 @@ class Chatline:
         The Rule is:
         <contact/phone number><separator><message body>
         """
-        match = re.match(re.compile(patterns.IS_CHAT, re.VERBOSE), body)
+        match = classifier.CHAT.match(body)
         if match:
             return match
 
@@ -69,10 +97,8 @@ class Chatline:
         """
         Deleted message
         """
-        for p in patterns.IS_DELETED_CHAT:
-            match = re.match(p, body)
-            if match:
-                return body
+        if self.line_classifier.classify_message(body) == "Deleted":
+            return body
         return None
 
     def contains_attachment(self, body=""):
@@ -81,40 +107,33 @@ class Chatline:
         Note: in Android, there is no difference pattern wether it's an image, 
             video, audio, gif, document or sticker.
         """
-        for p in patterns.IS_ATTACHMENT:
-            if re.match(p, body):
-                return body
+        if self.line_classifier.classify_message(body) == "Attachment":
+            return body
         return None
 
-    def extract_timestamp(self, time_string=""):
+    def extract_timestamp(self, starting_line):
         """
         EXTRACT TIMESTAMP
+        Built from the regex groups when the export format is known
+        (see timestamps.detect_format), dateutil otherwise.
         """
-        timestamp = parser.parse(time_string)
+        if self.timestamp_format:
+            return self.timestamp_format.from_match(starting_line)
+
+        timestamp = parser.parse(starting_line.group(2))
         return timestamp
 
     def extract_url(self, body=""):
         """
         Check if chat contais a url
         """
-        return re.findall(patterns.IS_URL, body)
+        return urls.extract_urls(body)
 
     def get_domain(self, url=""):
-        domain = url[0].replace("http://", '')
-        domain = domain.replace("https://", '')
-        domain = domain.split("/")
-        return domain[0]
-
-    def get_words(self, string=""):
-        #remove non alpha content
-        regex = re.sub(r"[^a-z\s]+", "", string.lower())
-        regex = re.sub(r'[^\x00-\x7f]',r'', regex)
-        words = re.sub(r"[^\w]", " ",  string).split()
-
-        return words
+        return urls.get_domain(url)
 
     def extract_emojis(self, string=""):
-        return [c["emoji"] for c in emoji.emoji_list(string)]
+        return extract_emojis(string)
 
     def is_event(self, body=""):
         """Detect wether the body of chat is event log.
@@ -139,11 +158,7 @@ class Chatline:
         The Rule is:
         Match the known event message
         """
-        for p in patterns.IS_EVENT:
-            match = re.match(p, body)
-            if match:
-                return match
-        return None
+        return self.line_classifier.is_event(body)
 
     def parse_line(self, line=""):
         line = self.replace_bad_character(line)
@@ -155,7 +170,7 @@ class Chatline:
             self.is_startingline = True
 
             # Extract timestamp
-            dt = self.extract_timestamp(starting_line.group(2))
+            dt = self.extract_timestamp(starting_line)
             # Set timestamp
             if dt:
                 self.timestamp = dt
@@ -170,10 +185,10 @@ class Chatline:
             self.is_followingline = True
 
             # Check if previous line has sender
-            if self.previous_line and self.previous_line.sender:
+            if self.state and self.state.sender:
                 # Set current line sender, timestamp same to previous line
-                self.sender = self.previous_line.sender
-                self.timestamp = self.previous_line.timestamp
+                self.sender = self.state.sender
+                self.timestamp = self.state.timestamp
                 self.line_type = "Chat"
 
             body = line
@@ -189,40 +204,83 @@ class Chatline:
             self.line_type = "Chat"
             message_body = body
             if not following:
-                self.sender = chat.group(1)
+                # one string object per sender, shared by all their lines
+                self.sender = sys.intern(chat.group(1))
                 message_body = chat.group(3)
 
             self.body = message_body
 
-            has_attachment = self.contains_attachment(message_body)
-            if has_attachment:
+            # Attachment & deleted check in a single scan
+            message_kind = self.line_classifier.classify_message(message_body)
+            if message_kind == "Attachment":
                 # Set chat type to attachment
                 self.line_type = "Attachment"
             else:
-                if self.is_deleted(message_body):
+                if message_kind == "Deleted":
                     # Set deleted
                     self.is_deleted_chat = True
                 else:
-                    words = message_body
-
                     #URL & Domain
-                    urls = self.extract_url(message_body)
-                    if urls:
-                        for i in urls:
-                            # Exclude url from words
-                            words = words.replace(i[0], "")
-
+                    if 'domain' in self.features:
+                        message_urls = self.extract_url(message_body)
+                        if message_urls:
                             # Set domains
-                            self.domains.append(self.get_domain(i))
-
-                    # Set Words
-                    self.words = self.get_words(words)
+                            self.domains = [self.get_domain(i) for i in message_urls]
 
                     #Emoji
-                    emjs = self.extract_emojis(message_body)
-                    if emjs:
-                        self.emojis = emjs
+                    if 'emoji' in self.features:
+                        emjs = self.extract_emojis(message_body)
+                        if emjs:
+                            self.emojis = emjs
 
         elif self.is_event(body):
             # Set line_type
             self.line_type = "Event"
+
+    def feature_body(self):
+        """
+        Body emoji & domain are extracted from, None for events,
+        attachments and deleted messages.
+        """
+        if self.line_type == "Chat" and not self.is_deleted_chat:
+            return self.body
+        return None
+
+
+def parse_chatlines(lines, timestamp_format=None, features=FEATURES, line_classifier=classifier.FULL, keep_body=None):
+    """
+    Parse lines one by one with Chatline into the timestamp and sender
+    columns consumed by read_chat_txt, plus a column per requested feature
+    (see exploded).
+    If some features are not requested, the message bodies are kept in a
+    'body' column so they can be extracted later without re-parsing.
+    keep_body=True keeps them anyway.
+    """
+    message = {
+        'timestamp': [],
+        'sender': [],
+    }
+    builders = {feature: exploded.Builder() for feature in features}
+    if keep_body is None:
+        keep_body = set(features) != set(FEATURES)
+    if keep_body:
+        message['body'] = []
+
+    state = ParserState()
+    for line in lines:
+        chatline = Chatline(line=line, state=state, timestamp_format=timestamp_format, line_classifier=line_classifier, features=features)
+        state.update(chatline)
+
+        message['timestamp'].append(chatline.timestamp)
+        message['sender'].append(chatline.sender)
+        if 'emoji' in features:
+            builders['emoji'].append(chatline.emojis)
+        if 'domain' in features:
+            builders['domain'].append(chatline.domains)
+        if keep_body:
+            message['body'].append(chatline.feature_body())
+
+    for feature, builder in builders.items():
+        message[feature] = builder.build()
+
+    return message
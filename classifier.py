@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Line classifier, compiled once per set of export languages.
+
+Every pattern family in patterns.py is merged into a single alternation with
+a named group per family, so a message body is classified in one scan instead
+of one re.match per pattern. A cheap keyword check runs first and rejects the
+large majority of plain chat bodies without touching the regex engine.
+
+Patterns come in one pack per language (patterns.LOCALES). detect_locales
+picks the packs an export is written in, so the hot loop only tests those.
+"""
+import re
+from itertools import islice
+import patterns
+
+BAD_CHARS_TABLE = str.maketrans({c: None for c in patterns.BAD_CHARS})
+
+STARTING_LINE = re.compile(patterns.IS_STARTING_LINE, re.VERBOSE)
+CHAT = re.compile(patterns.IS_CHAT, re.VERBOSE)
+
+# shape of an android media placeholder, e.g. '<Media omitted>'
+PLACEHOLDER = re.compile(r"<[^<>]+>$")
+
+DETECT_SIZE = 2000
+
+
+def _alternation(pattern_list):
+    if not pattern_list:
+        # never matches
+        return "(?!)"
+    return "|".join("(?:{})".format(p) for p in pattern_list)
+
+
+def clean_line(line=""):
+    return line.strip().translate(BAD_CHARS_TABLE)
+
+
+class Classifier:
+
+    def __init__(self, locales=tuple(patterns.LOCALES)):
+        self.locales = tuple(locales)
+        packs = [patterns.LOCALES[locale] for locale in self.locales]
+
+        # Attachment is tried before deleted, same order as Chatline.parse_body
+        self.message_kind = re.compile(
+            "(?P<attachment>{})|(?P<deleted>{})".format(
+                _alternation([p for pack in packs for p in pack['attachment']]),
+                _alternation([p for pack in packs for p in pack['deleted']]),
+            )
+        )
+        self.event = re.compile(_alternation([p for pack in packs for p in pack['event']]))
+        self.keywords = tuple(sorted({k for pack in packs for k in pack['keywords']}))
+
+    def __repr__(self):
+        return "{}(locales={})".format(type(self).__name__, self.locales)
+
+    def classify_message(self, body=""):
+        """
+        Classify a chat message body in one scan.
+        Return "Attachment", "Deleted" or None for a regular message.
+        """
+        for keyword in self.keywords:
+            if keyword in body:
+                break
+        else:
+            return None
+
+        match = self.message_kind.match(body)
+        if match is None:
+            return None
+        if match.group("attachment") is not None:
+            return "Attachment"
+        return "Deleted"
+
+    def is_event(self, body=""):
+        return self.event.match(body)
+
+
+class LocaleClassifier(Classifier):
+    """
+    Classifier for the detected languages of an export. Switches to every
+    language as soon as a marker shows up that only another language knows:
+    a media placeholder or a system line (a starting line which isn't a chat)
+    the detected languages don't recognize.
+    """
+
+    def __init__(self, locales):
+        super().__init__(locales)
+        self.fallback = False
+
+    def use_full_set(self):
+        self.fallback = True
+        self.locales = FULL.locales
+        self.message_kind = FULL.message_kind
+        self.event = FULL.event
+        self.keywords = FULL.keywords
+
+    def classify_message(self, body=""):
+        kind = super().classify_message(body)
+        if kind is None and not self.fallback and PLACEHOLDER.search(body) and FULL.classify_message(body):
+            self.use_full_set()
+            return FULL.classify_message(body)
+        return kind
+
+    def is_event(self, body=""):
+        match = self.event.match(body)
+        if match is None and not self.fallback:
+            match = FULL.is_event(body)
+            if match:
+                self.use_full_set()
+        return match
+
+
+FULL = Classifier()
+
+
+def detect_locales(lines, size=DETECT_SIZE):
+    """
+    Pick the languages whose attachment, deleted or event markers show up in
+    the first lines of an export. Every language if none does.
+    """
+    found = set()
+    for line in islice(lines, size):
+        line = clean_line(line)
+        starting_line = STARTING_LINE.match(line)
+        body = starting_line.group(18) if starting_line else line
+        chat = CHAT.match(body) if starting_line else None
+        for locale in FULL.locales:
+            if locale in found:
+                continue
+            pack = LOCALE_CLASSIFIERS[locale]
+            if chat and pack.classify_message(chat.group(3)):
+                found.add(locale)
+            elif not chat and starting_line and pack.is_event(body):
+                found.add(locale)
+
+    if not found:
+        return FULL
+    return LocaleClassifier([locale for locale in FULL.locales if locale in found])
+
+
+LOCALE_CLASSIFIERS = {locale: Classifier([locale]) for locale in patterns.LOCALES}
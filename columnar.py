@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar parse engine for read_chat_txt(engine='columnar').
+
+Same rules as Chatline, applied to batches of lines at once: the starting
+line and chat patterns run through vectorized str.extract, sender and
+timestamp are forward filled into the following (multiline) lines, and
+emoji/URL extraction only runs on the rows that may contain them.
+
+parse_stream cuts the lines into batches of BATCH_LINES at starting lines,
+so the string columns of a large export are never built for all of its
+lines at once.
+"""
+import re
+import sys
+import numpy as np
+import pandas as pd
+import classifier
+import exploded
+import patterns
+from chatline import FEATURES
+from emojis import extract_emojis_batch
+from urls import URL_HINT, extract_domains
+
+NON_ASCII = r"[^\x00-\x7f]"
+
+# IS_STARTING_LINE body group and IS_CHAT groups, 0-indexed
+STARTING_BODY = 17
+DATETIME = 1
+CHAT_SENDER = 0
+CHAT_MESSAGE = 2
+
+# lines parsed at once by parse_stream
+BATCH_LINES = 100_000
+
+# Placeholder sender of starting lines that are not chat (events),
+# IS_CHAT never captures an empty sender
+NO_SENDER = ""
+
+
+def extract_features(body, features=FEATURES):
+    """
+    Extract the requested features from a Series of message bodies, None
+    for rows without features (events, attachments, deleted messages).
+    Extraction only runs on the rows that may contain the feature.
+    Returns one exploded column per feature, aligned with body.
+    """
+    body = body.reset_index(drop=True)
+    n = len(body)
+    result = {}
+
+    if 'emoji' in features:
+        emoji_rows = body[body.str.contains(NON_ASCII, regex=True, na=False)]
+        result['emoji'] = scatter(n, emoji_rows.index, extract_emojis_batch(emoji_rows.tolist()))
+
+    if 'domain' in features:
+        domain_rows = body[body.str.contains(URL_HINT.pattern, regex=True, na=False)]
+        result['domain'] = scatter(n, domain_rows.index, map(extract_domains, domain_rows))
+
+    return result
+
+
+def scatter(n, rows, lists):
+    """
+    Exploded column of n messages, rows (ascending) holding lists, the
+    other messages nothing.
+    """
+    counts = np.zeros(n, dtype=np.int64)
+    values = []
+    for i, found in zip(rows, lists):
+        counts[i] = len(found)
+        values.extend(found)
+
+    return exploded.from_flat(values, counts)
+
+
+def classify_in_order(line_classifier, messages, events):
+    """
+    Kind of every message, classified along with the events in line order
+    like Chatline does: a marker only another language knows switches a
+    LocaleClassifier to every language from that line on.
+    """
+    kind = {}
+    for row, text in pd.concat([messages, events]).sort_index().items():
+        if row in messages.index:
+            kind[row] = line_classifier.classify_message(text)
+        else:
+            line_classifier.is_event(text)
+
+    return pd.Series(kind, index=messages.index, dtype=object)
+
+
+def parse_lines(lines, timestamp_format, features=FEATURES, line_classifier=classifier.FULL, keep_body=None):
+    """
+    Parse a list of raw lines into the timestamp and sender columns consumed
+    by read_chat_txt, plus a column per requested feature. Same 'body'
+    column as chatline.parse_chatlines if some features are not requested
+    or keep_body=True.
+    """
+    line = pd.Series(lines, dtype=object).str.strip().str.translate(classifier.BAD_CHARS_TABLE)
+
+    starting = line.str.extract(patterns.IS_STARTING_LINE, flags=re.VERBOSE)
+    is_starting = starting[DATETIME].notna()
+
+    body = starting.loc[is_starting, STARTING_BODY]
+    chat = body.str.extract(patterns.IS_CHAT, flags=re.VERBOSE)
+    is_chat = chat[CHAT_SENDER].notna()
+    chat[CHAT_SENDER] = chat.loc[is_chat, CHAT_SENDER].map(sys.intern)
+
+    # sender & timestamp of starting lines, forward filled into following lines
+    sender = pd.Series(None, index=line.index, dtype=object)
+    sender[is_starting] = chat[CHAT_SENDER].where(is_chat, NO_SENDER)
+    sender = sender.ffill()
+
+    timestamp = pd.Series(pd.NaT, index=line.index, dtype='datetime64[ns]')
+    if is_starting.any():
+        timestamp[is_starting] = timestamp_format.from_groups(starting[is_starting])
+    timestamp = timestamp.ffill()
+
+    # following lines only inherit from a previous line that has a sender
+    no_sender = sender.isna() | (sender == NO_SENDER)
+    timestamp[~is_starting & no_sender] = pd.NaT
+    sender[no_sender] = None
+
+    # message body: chat part of starting lines, whole line of following lines
+    message = line.where(~is_starting)
+    message[is_starting] = chat[CHAT_MESSAGE]
+
+    # attachments & deleted messages have no features, markers of every
+    # language and media placeholders are candidates
+    kind_hint = "|".join([re.escape(k) for k in classifier.FULL.keywords] + [classifier.PLACEHOLDER.pattern])
+    kind_candidate = message.str.contains(kind_hint, regex=True, na=False)
+    kind = classify_in_order(line_classifier, message[kind_candidate], body[~is_chat])
+    message[kind[kind.notna()].index] = None
+
+    result = {
+        'timestamp': timestamp,
+        'sender': sender.tolist(),
+    }
+    result.update(extract_features(message, features))
+    if keep_body is None:
+        keep_body = set(features) != set(FEATURES)
+    if keep_body:
+        result['body'] = message.where(message.notna(), None).tolist()
+
+    return result
+
+
+def iter_batches(lines, size=BATCH_LINES):
+    """
+    Lists of about size lines, every one but the first starting with a
+    starting line, so no multiline message is cut.
+    """
+    batch = []
+    for line in lines:
+        if len(batch) >= size and classifier.STARTING_LINE.match(classifier.clean_line(line)):
+            yield batch
+            batch = []
+        batch.append(line)
+
+    if batch:
+        yield batch
+
+
+def concat_columns(results):
+    """
+    Columns of consecutive runs of lines, concatenated in order.
+    """
+    message = {}
+    for column, first in results[0].items():
+        if isinstance(first, pd.Series):
+            message[column] = pd.concat([r[column] for r in results], ignore_index=True)
+        elif column in FEATURES:
+            message[column] = exploded.concat([r[column] for r in results])
+        else:
+            message[column] = [value for r in results for value in r[column]]
+
+    return message
+
+
+def parse_stream(lines, timestamp_format, features=FEATURES, line_classifier=classifier.FULL, keep_body=None, batch_size=BATCH_LINES):
+    """
+    parse_lines over an iterable of lines, batch_size lines at a time.
+    """
+    results = [
+        parse_lines(batch, timestamp_format, features, line_classifier, keep_body)
+        for batch in iter_batches(lines, batch_size)
+    ]
+    if len(results) == 1:
+        return results[0]
+    return concat_columns(results or [parse_lines([], timestamp_format, features, line_classifier, keep_body)])
@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Activity cube: number of messages per day × hour, and per day × sender.
+
+Built from chat_df with np.bincount over integer codes. Every day, dow,
+hour, month, week and sender summary of the dashboard is a reduction of it
+over a few thousand cells instead of a groupby over every message, and
+hours without message are zeros instead of missing rows.
+
+Day × hour counts are dense, there are only 24 hours a day. Day × sender
+counts are a scipy.sparse CSR matrix: a group of 1000 members only sends
+messages on a few of the days × senders cells, so its memory grows with
+the messages instead of days × senders.
+
+Prefix sums over the days give the hour counts of any period in one
+subtraction. They are built with the cube, so its size is known when it is
+cached, and the cube of a period (window) is a view of the days it spans,
+sharing those prefix sums.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from dates import calendar_columns
+
+HOURS = 24
+# a day × hour or day × sender cell never counts 2 ** 31 messages
+COUNT_DTYPE = np.int32
+
+
+class ActivityCube:
+    """
+    counts[day, hour] messages and events[day, hour] lines without sender,
+    which make a day or an hour active without being messages, days counted
+    from start. day_sender() has the messages of every day by sender.
+    """
+    __slots__ = ('counts', 'events', 'sender_counts', 'start', 'senders', 'prefix', '__weakref__')
+
+    def __init__(self, counts, events, sender_counts, start, senders, prefix=None):
+        self.counts = counts
+        self.events = events
+        self.sender_counts = sender_counts
+        self.start = start
+        self.senders = senders
+        if prefix is None:
+            prefix = np.zeros((counts.shape[0] + 1, HOURS), dtype=np.int64)
+            np.cumsum(counts, axis=0, out=prefix[1:])
+        self.prefix = prefix
+
+    @classmethod
+    def from_chat_df(cls, chat_df):
+        date = chat_df['date'].to_numpy(dtype='datetime64[D]')
+        start = date.min()
+        day = (date - start).astype(np.int64)
+        n_days = int(day.max()) + 1
+
+        # NaN senders (events) have code -1
+        sender = pd.Categorical(chat_df['sender'])
+        message = sender.codes >= 0
+
+        cell = day * HOURS + chat_df['hour'].to_numpy(dtype=np.int64)
+        counts, events = (
+            np.bincount(cell[rows], minlength=n_days * HOURS).reshape(n_days, HOURS).astype(COUNT_DTYPE)
+            for rows in (message, ~message)
+        )
+
+        # duplicate cells are summed by the COO -> CSR conversion
+        sender_counts = sparse.coo_matrix(
+            (np.ones(message.sum(), dtype=COUNT_DTYPE), (day[message], sender.codes[message])),
+            shape=(n_days, len(sender.categories)),
+        ).tocsr()
+
+        return cls(counts, events, sender_counts, start, sender.categories)
+
+    def merge(self, other):
+        """
+        Cube of the messages of both cubes, e.g. of the new rows of an
+        appended export (see ingest).
+        """
+        start = min(self.start, other.start)
+        end = max(self.start + self.counts.shape[0], other.start + other.counts.shape[0])
+        n_days = int((end - start).astype(np.int64))
+        senders = self.senders.union(other.senders)
+
+        counts = np.zeros((n_days, HOURS), dtype=COUNT_DTYPE)
+        events = np.zeros((n_days, HOURS), dtype=COUNT_DTYPE)
+        day, sender, cnt = [], [], []
+        for cube in (self, other):
+            first = int((cube.start - start).astype(np.int64))
+            counts[first:first + cube.counts.shape[0]] += cube.counts
+            events[first:first + cube.counts.shape[0]] += cube.events
+
+            cells = cube.sender_counts.tocoo()
+            day.append(cells.row + first)
+            sender.append(senders.get_indexer(cube.senders)[cells.col])
+            cnt.append(cells.data)
+
+        sender_counts = sparse.coo_matrix(
+            (np.concatenate(cnt), (np.concatenate(day), np.concatenate(sender))),
+            shape=(n_days, len(senders)),
+        ).tocsr()
+
+        return ActivityCube(counts, events, sender_counts, start, senders)
+
+    def __repr__(self):
+        return "ActivityCube(start={}, days={}, senders={})".format(self.start, self.counts.shape[0], len(self.senders))
+
+    @property
+    def nbytes(self):
+        # the arrays a window shares with its cube are counted by the cube
+        matrix = self.sender_counts
+        return sum(
+            array.nbytes for array in (self.counts, self.events, self.prefix)
+            if array.flags.owndata
+        ) + matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+
+    def cumulative(self):
+        """
+        Prefix sums of counts over days, one more row than days: the counts
+        of days [a, b) are cumulative()[b] - cumulative()[a].
+        """
+        return self.prefix
+
+    def totals(self):
+        """
+        Messages of every hour of day over every day of the cube.
+        """
+        prefix = self.cumulative()
+        return prefix[-1] - prefix[0]
+
+    def sender_totals(self):
+        """
+        Messages of every sender over every day of the cube.
+        """
+        return np.asarray(self.sender_counts.sum(axis=0, dtype=np.int64)).ravel()
+
+    def window(self, start, end):
+        """
+        Cube of the days from date start to date end included.
+        """
+        n_days = self.counts.shape[0]
+        first = int(np.clip((np.datetime64(start, 'D') - self.start).astype(np.int64), 0, n_days))
+        last = int(np.clip((np.datetime64(end, 'D') - self.start).astype(np.int64) + 1, first, n_days))
+        if (first, last) == (0, n_days):
+            return self
+
+        return ActivityCube(
+            self.counts[first:last], self.events[first:last], self.sender_counts[first:last],
+            self.start + first, self.senders, self.cumulative()[first:last + 1],
+        )
+
+    def days(self):
+        return self.start + np.arange(self.counts.shape[0])
+
+    def calendar(self):
+        """
+        calendar_columns of every day.
+        """
+        return calendar_columns(pd.Series(self.days()))
+
+    def day_hour(self):
+        return self.counts
+
+    def day_sender(self):
+        """
+        Sparse counts[day, sender].
+        """
+        return self.sender_counts
+
+    def active_day_hours(self):
+        return (self.counts > 0) | (self.events > 0)
+
+    def day_frame(self):
+        """
+        One row per active day: its calendar columns and cnt_msg.
+        """
+        active = self.active_day_hours().any(axis=1)
+        day_frame = pd.DataFrame(self.calendar())
+        day_frame['cnt_msg'] = self.day_hour().sum(axis=1)
+        return day_frame[active].reset_index(drop=True)
+
+    def day_hour_frame(self):
+        """
+        One row per active hour of every day: date, dow, hour and cnt_msg.
+        """
+        day, hour = np.nonzero(self.active_day_hours())
+        calendar = self.calendar()
+        return pd.DataFrame({
+            'date': calendar['date'][day],
+            'dow': calendar['dow'][day],
+            'hour': hour.astype(np.int8),
+            'cnt_msg': self.day_hour()[day, hour],
+        })
+
+    def hour_frame(self):
+        """
+        Average number of messages over the active hours of every hour of
+        day, and their sum.
+        """
+        active = self.active_day_hours()
+        hour = np.broadcast_to(np.arange(HOURS), active.shape)[active]
+        cnt_msg = self.day_hour()[active]
+
+        sum_msg = self.totals()
+        active_hours = np.bincount(hour, minlength=HOURS)
+        has = active_hours > 0
+        return pd.DataFrame({
+            'hour': np.flatnonzero(has),
+            'avg_msg': sum_msg[has] / active_hours[has],
+            'sum_msg': sum_msg[has],
+        })
+
+    def dow_hour_frame(self):
+        """
+        Average number of messages by day of week & hour over every day of
+        the period, the days without message included.
+        """
+        dow = self.calendar()['dow']
+        dow_hour_sum = np.zeros((7, HOURS), dtype=np.int64)
+        np.add.at(dow_hour_sum, dow, self.day_hour())
+        days_per_dow = np.bincount(dow, minlength=7)
+
+        has = np.repeat(days_per_dow > 0, HOURS)
+        return pd.DataFrame({
+            'dow': np.repeat(np.arange(7), HOURS)[has],
+            'hour': np.tile(np.arange(HOURS), 7)[has],
+            'avg_msg': (dow_hour_sum / np.maximum(days_per_dow, 1)[:, None]).ravel()[has],
+        })
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+"""
+Calendar columns of a timestamp column, in one vectorized pass.
+
+Dates, week starts and months stay datetime64 and the other fields small
+integers, computed with numpy arithmetic on the datetime64 values, so
+nothing is converted to a Python date or formatted row by row and later
+groupbys run on native types.
+"""
+import numpy as np
+import pandas as pd
+
+HOUR = np.timedelta64(1, 'h')
+# 1970-01-01, day 0 of datetime64[D], was a Thursday
+EPOCH_DOW = 3
+
+
+def calendar_columns(timestamp):
+    """
+    date, week (its monday), month_full (first day), month ('YYYY-MM'
+    categorical), day of month, dow (0 = Monday) and hour of every
+    timestamp, which must not be NaT.
+    """
+    value = timestamp.to_numpy(dtype='datetime64[ns]')
+    date = value.astype('datetime64[D]')
+    month_full = value.astype('datetime64[M]')
+
+    dow = (date.astype(np.int64) + EPOCH_DOW) % 7
+    # months are formatted once each, rows only keep a code
+    months, month_code = np.unique(month_full, return_inverse=True)
+
+    return {
+        'month_full': month_full,
+        'month': pd.Categorical.from_codes(month_code.ravel(), np.datetime_as_string(months, unit='M')),
+        'day': ((date - month_full).astype(np.int64) + 1).astype(np.int8),
+        'date': date,
+        'dow': dow.astype(np.int8),
+        'hour': ((value - date) // HOUR).astype(np.int8),
+        'week': date - dow.astype('timedelta64[D]'),
+    }
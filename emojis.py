@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+Emoji extraction.
+
+Every emoji sequence known to the emoji package (including ZWJ and skin
+tone sequences) is put in a trie once at import. A body is scanned by
+jumping from one non-ASCII character (or the ASCII start of a keycap like
+1️⃣) to the next with a regex and walking the trie from there, always
+taking the longest sequence. ASCII-only bodies, the large majority, return
+immediately.
+"""
+import re
+import emoji
+
+# keycap sequences start with an ASCII digit, '#' or '*'
+EMOJI_START = re.compile(r"[^\x00-\x7f]|[0-9#*](?=[\ufe0f\u20e3])")
+
+# shared by every body without emoji, like chatline.EMPTY
+NO_EMOJI = ()
+
+# bodies are single lines, so a newline can join them for batch scans
+SEPARATOR = "\n"
+
+
+def build_trie(sequences):
+    trie = {}
+    for sequence in sequences:
+        node = trie
+        for char in sequence:
+            node = node.setdefault(char, {})
+        # end of a sequence
+        node[""] = True
+
+    return trie
+
+
+EMOJI_TRIE = build_trie(emoji.EMOJI_DATA)
+
+
+def iter_emojis(string="", trie=EMOJI_TRIE, search=EMOJI_START.search):
+    """
+    Yield (start, emoji) for every emoji of string, longest sequence first.
+    """
+    n = len(string)
+    match = search(string)
+    while match:
+        i = match.start()
+        node = trie.get(string[i])
+        end = 0
+        if node is not None:
+            j = i + 1
+            if "" in node:
+                end = j
+            while j < n:
+                node = node.get(string[j])
+                if node is None:
+                    break
+                j += 1
+                if "" in node:
+                    end = j
+
+        if end:
+            yield i, string[i:end]
+            match = search(string, end)
+        else:
+            match = search(string, i + 1)
+
+
+def extract_emojis(string=""):
+    if string.isascii():
+        return NO_EMOJI
+    return [e for _, e in iter_emojis(string)] or NO_EMOJI
+
+
+def extract_emojis_batch(bodies):
+    """
+    extract_emojis over many bodies, scanning the non-ASCII ones joined
+    together in one pass. Returns one list per body.
+    """
+    result = [NO_EMOJI] * len(bodies)
+    index = [i for i, body in enumerate(bodies) if not body.isascii()]
+    if not index:
+        return result
+
+    line = 0
+    line_end = len(bodies[index[0]])
+    for start, e in iter_emojis(SEPARATOR.join(bodies[i] for i in index)):
+        while start > line_end:
+            line += 1
+            line_end += len(bodies[index[line]]) + len(SEPARATOR)
+        i = index[line]
+        if result[i] is NO_EMOJI:
+            result[i] = []
+        result[i].append(e)
+
+    return result
@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""
+Emoji & domain columns stored like a CSR matrix.
+
+Instead of one Python list per message, the values of every message are
+kept in one flat array of categorical codes, message i owning
+values[offsets[i]:offsets[i + 1]]. The column is a pyarrow list of
+dictionary array, which is that exact layout, so it still filters,
+concatenates and goes to Parquet like any other chat_df column, while
+aggregations read its offsets and codes with np.repeat/np.bincount
+instead of looping over lists.
+"""
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+VALUE_TYPE = pa.dictionary(pa.int32(), pa.string())
+DTYPE = pd.ArrowDtype(pa.list_(VALUE_TYPE))
+
+
+class Builder:
+    """
+    Collects the values of one message after the other.
+    """
+    __slots__ = ('values', 'counts')
+
+    def __init__(self):
+        self.values = []
+        self.counts = []
+
+    def append(self, values):
+        self.values.extend(values)
+        self.counts.append(len(values))
+
+    def build(self):
+        return from_flat(self.values, self.counts)
+
+
+def from_flat(values, counts):
+    """
+    Column of len(counts) messages, message i holding the next counts[i]
+    of values.
+    """
+    offsets = np.zeros(len(counts) + 1, dtype=np.int32)
+    np.cumsum(counts, out=offsets[1:])
+    codes, categories = pd.factorize(np.asarray(values, dtype=object))
+
+    dictionary = pa.DictionaryArray.from_arrays(
+        pa.array(codes, type=pa.int32()),
+        pa.array(categories, type=pa.string()),
+    )
+    return pd.arrays.ArrowExtensionArray(pa.ListArray.from_arrays(pa.array(offsets), dictionary))
+
+
+def from_lists(lists):
+    builder = Builder()
+    for values in lists:
+        builder.append(values)
+    return builder.build()
+
+
+def types_mapper(arrow_type):
+    """
+    For pyarrow's to_pandas: exploded columns read from Parquet stay exploded.
+    """
+    if pa.types.is_list(arrow_type):
+        return pd.ArrowDtype(arrow_type)
+    return None
+
+
+def concat(columns):
+    return pd.concat([pd.Series(column, dtype=DTYPE) for column in columns], ignore_index=True).array
+
+
+def components(column):
+    """
+    CSR parts of a column: offsets (one more than messages), the codes of
+    every value in message order and the categories they index.
+    """
+    array = pa.Array.from_pandas(column)
+    if isinstance(array, pa.ChunkedArray):
+        # unifies the dictionaries of the chunks
+        array = array.combine_chunks()
+
+    offsets = array.offsets.to_numpy()
+    values = array.flatten()
+    return offsets - offsets[0], values.indices.to_numpy(), values.dictionary.to_numpy(zero_copy_only=False)
+
+
+def counts(column):
+    """
+    Number of values of every message.
+    """
+    offsets, _, _ = components(column)
+    return np.diff(offsets)
+
+
+def explode(chat_df, feature, columns):
+    """
+    One row per value of feature, with the given columns of its message.
+    """
+    offsets, codes, categories = components(chat_df[feature])
+    rows = np.repeat(np.arange(len(chat_df)), np.diff(offsets))
+
+    expanded = chat_df[list(columns)].iloc[rows].reset_index(drop=True)
+    expanded[feature] = categories.take(codes)
+    return expanded
+
+
+def value_counts(column, name):
+    """
+    Number of occurrences of every value, sorted by value.
+    """
+    _, codes, categories = components(column)
+    cnt = np.bincount(codes, minlength=len(categories))
+
+    value_cnt = pd.DataFrame({name: categories, 'cnt': cnt})
+    # filtered columns keep the categories of the rows they lost
+    return value_cnt[value_cnt['cnt'] > 0].sort_values(name).reset_index(drop=True)
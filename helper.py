@@ -1,14 +1,30 @@
 import numpy as np
 import pandas as pd
 import scipy.stats as stats
-from chatline import Chatline
+from chatline import FEATURES, parse_chatlines
+from timestamps import detect_format
+import columnar
+import parallel
+import chat_cache
+import chartdata
+import ingest
+import timeindex
+import exploded
+import schema
+from reader import iter_lines
+from classifier import detect_locales
+from dates import calendar_columns
+from cube import ActivityCube
+from replies import ReplyGraph
+from topk import top_k
+from memo import cached
 import matplotlib.pyplot as plt
 import altair as alt
 from dateutil.relativedelta import relativedelta
 from operator import itemgetter
+from itertools import islice
 import re
 import string
-import streamlit as st
 
 dow_dict = {
     0: 'Monday',
@@ -20,74 +36,179 @@ dow_dict = {
     6: 'Sunday',
 }
 
-@st.experimental_singleton(show_spinner=False)
-def read_chat_txt(chat_txt):
+@cached
+def read_chat_txt(chat_txt, engine = 'python', workers = None, features = FEATURES):
 	# the most important piece of code to read txt lol		
-	lines = chat_txt.getvalue().decode('utf-8').splitlines() 
-	
-	message = {
-		'timestamp': [],
-		'sender': [],
-		'emoji': [],
-		'domain': []
-	}
-
-	previous_line = None
-	for line in lines:
-		chatline = Chatline(line=line, previous_line=previous_line)
-		previous_line = chatline
-	    
-		message['timestamp'].append(chatline.timestamp)
-		message['sender'].append(chatline.sender)
-		message['emoji'].append(chatline.emojis)
-		message['domain'].append(chatline.domains)
+	# engine: 'python' parses line by line with Chatline,
+	# 'columnar' parses batches of lines with vectorized pandas string ops
+	# lines are streamed from the uploaded file in chunks, once for the
+	# timestamp format & languages, and once for parsing
+	# workers: number of parsing processes for exports with more than
+	# parallel.PARALLEL_MIN_BYTES left to parse, None for one per CPU, 1 to
+	# stay serial
+	# features: emoji/domain columns to extract while parsing, the others
+	# are extracted on demand by with_features
+
+	# parsed chats are kept on disk across restarts if WA_VIZ_CACHE_DIR is set,
+	# with every feature extracted so no message body is stored
+	if chat_cache.enabled():
+		cache_key = chat_cache.cache_key(chat_txt)
+		chat_df = chat_cache.load(cache_key)
+		if chat_df is not None:
+			return chat_df
+		features = FEATURES
+
+	# a newer export of a chat parsed before only has its new lines parsed,
+	# and appended to the older chat_df (see ingest)
+	blocks = ingest.block_hashes(iter_lines(chat_txt))
+	base_df, start = ingest.find_base(blocks, features)
+
+	chat_df = parse_export(chat_txt, start, engine, workers, features)
+	if base_df is not None:
+		chat_df = ingest.append(base_df, chat_df)
+	ingest.remember(blocks, features, chat_df)
+
+	if chat_cache.enabled():
+		chat_cache.store(cache_key, chat_df)
+		chat_cache.store_blocks(blocks, cache_key)
 
-	chat_df = pd.DataFrame(message)
-	chat_df['month_full'] = chat_df['timestamp'].to_numpy().astype('datetime64[M]')
-	chat_df['month'] = chat_df['timestamp'].map(lambda x: x.strftime('%Y-%m'))
-	chat_df['day'] = chat_df['timestamp'].dt.day
-	chat_df['date'] = chat_df['timestamp'].dt.date
-	chat_df['dow'] = chat_df['timestamp'].dt.dayofweek
-	chat_df['hour'] = chat_df['timestamp'].dt.hour
-	chat_df['week'] = chat_df['date'] - pd.to_timedelta(chat_df['timestamp'].dt.dayofweek, unit='d')
+	return chat_df
+
+def parse_export(chat_txt, start, engine, workers, features):
+	# chat_df of the lines of chat_txt from line start on
+	timestamp_format = detect_format(iter_lines(chat_txt))
+	line_classifier = detect_locales(iter_lines(chat_txt))
+	lines = iter_lines(chat_txt)
+
+	# only what's left after start decides whether a pool is worth it:
+	# the upload is read up to about there once the lines before are skipped
+	parsed_bytes = chat_txt.getbuffer().nbytes
+	if start:
+		for _ in islice(lines, start):
+			pass
+		parsed_bytes -= chat_txt.tell()
+
+	# bodies are kept to tell the messages of overlapping exports apart
+	if parallel.worker_count(workers) > 1 and parsed_bytes >= parallel.PARALLEL_MIN_BYTES:
+		message = parallel.parse_lines(lines, timestamp_format, engine = engine, workers = workers, features = features, line_classifier = line_classifier, keep_body = True)
+	elif engine == 'columnar':
+		message = columnar.parse_stream(lines, timestamp_format, features = features, line_classifier = line_classifier, keep_body = True)
+	else:
+		message = parse_chatlines(lines, timestamp_format, features = features, line_classifier = line_classifier, keep_body = True)
+
+	# categorical senders & months, small int calendar fields
+	chat_df = schema.compact(chat_frame(message))
+
+	# with every feature extracted, only a hash of the bodies is needed
+	if set(features) == set(FEATURES):
+		chat_df = chat_df.assign(row_key = ingest.row_keys(chat_df)).drop(columns = 'body')
 
 	return chat_df
 
-@st.experimental_singleton(show_spinner=False)
-def general_aggregation(chat_df):
+def chat_frame(message):
+	# parsed columns with the calendar columns used by the aggregations
+	chat_df = pd.DataFrame(message)
+	# lines before the first message of the export have no timestamp
+	chat_df = chat_df[chat_df['timestamp'].notna()].reset_index(drop = True)
+
+	return chat_df.assign(**calendar_columns(chat_df['timestamp']))
+
+@cached
+def with_features(chat_df, features):
+	# add the emoji/domain columns read_chat_txt didn't extract, from the kept message bodies
+	missing = [feature for feature in features if feature not in chat_df]
+	if not missing:
+		return chat_df
+
+	# periods slice the features of the whole chat
+	parent_df, rows = timeindex.parent_of(chat_df)
+	if parent_df is not None:
+		parent_df = with_features(parent_df, features)
+		return chat_df.assign(**{feature: parent_df[feature].array[rows] for feature in missing})
+
+	# appended exports only extract the features of their new rows
+	base_df = ingest.base_of(chat_df)
+	if base_df is not None:
+		base_df = with_features(base_df, features)
+		tail = columnar.extract_features(chat_df['body'].iloc[len(base_df):], missing)
+		return chat_df.assign(**{feature: exploded.concat([base_df[feature], tail[feature]]) for feature in missing})
+
+	return chat_df.assign(**columnar.extract_features(chat_df['body'], missing))
+
+@cached
+def activity_cube(chat_df):
+	# messages per day x hour and day x sender, with np.bincount
+	# every day/dow/hour/month/week/sender summary below is a reduction of it
+	# appended exports only count their new rows
+	base_df = ingest.base_of(chat_df)
+	if base_df is not None:
+		cube = activity_cube(base_df)
+		if len(chat_df) > len(base_df):
+			cube = cube.merge(ActivityCube.from_chat_df(chat_df.iloc[len(base_df):]))
+		# a base loaded from the disk cache isn't needed anymore
+		ingest.release_base(chat_df)
+		return cube
+
+	return ActivityCube.from_chat_df(chat_df)
+
+@cached
+def time_index(chat_df):
+	# timestamps sorted once, periods are cut with np.searchsorted
+	return timeindex.TimeIndex.from_chat_df(chat_df)
+
+@cached
+def chat_period(chat_df, start, end):
+	# messages from date start to date end included
+	return time_index(chat_df).take(chat_df, start, end)
+
+@cached
+def cube_period(chat_df, start, end):
+	# activity cube of the days from start to end, a view of the whole chat's cube
+	return activity_cube(chat_df).window(start, end)
+
+@cached
+def top_senders(cube, n):
+	# the n senders with the most messages, most active first
+	# the first two are compared head to head, they stay in sender order so
+	# a two-person chat reads the same whoever sent more
+	sum_msg = cube.sender_totals()
+	top = np.argsort(-sum_msg, kind = 'stable')[:n]
+	top = top[sum_msg[top] > 0]
+	top[:2] = np.sort(top[:2])
+	return tuple(cube.senders[top])
+
+def sender_rows(frame, senders):
+	# rows of frame of the given senders, in their order
+	return pd.DataFrame({'sender': list(senders)}).merge(frame.astype({'sender': object}), on = 'sender')
+
+@cached
+def general_aggregation(cube):
 	# aggregation by date, sender
-	agg_day_sender = chat_df.groupby(['date', 'sender']).agg(
-	    cnt_msg = pd.NamedAgg('sender', aggfunc = 'count')
-	).reset_index()
+	day_sender = cube.day_sender().tocoo()
+	agg_day_sender = pd.DataFrame({
+	    'date': cube.days()[day_sender.row],
+	    'sender': pd.Categorical.from_codes(day_sender.col, cube.senders),
+	    'cnt_msg': day_sender.data,
+	})
 
 	# aggregation by date, month
-	agg_day = chat_df.groupby(['date', 'day', 'week', 'month']).agg(
-	    cnt_msg = pd.NamedAgg('sender', aggfunc = 'count')
-	).reset_index()
+	agg_day = cube.day_frame()[['date', 'day', 'week', 'month', 'cnt_msg']]
 
 	# aggregation by date, dow, hour
-	agg_day_dow_hour = chat_df.groupby(['date', 'dow', 'hour']).agg(
-	    cnt_msg = pd.NamedAgg('sender', aggfunc = 'count')
-	).reset_index()
-
-	# complete list for hours with no message
-	full_day = pd.DataFrame({'date': pd.date_range(start= agg_day['date'].min(), end = agg_day['date'].max()).date, 'key': 0})
-	full_dow = pd.DataFrame({'dow': range(0,7), 'key': 0})
-	full_hour = pd.DataFrame({'hour': range(0,24), 'key': 0})
-	full_day_dow_hour = full_day.merge(full_dow, how = 'outer').merge(full_hour, how = 'outer').drop(columns = 'key')
+	agg_day_dow_hour = cube.day_hour_frame()
 
-	full_day_dow_hour_agg = full_day_dow_hour.merge(agg_day_dow_hour, how = 'left').fillna(0)
-
-	# daily msg aggregation by sender
-	sender_daily_agg = agg_day_sender.groupby('sender').agg(
-	    sum_msg = pd.NamedAgg('cnt_msg', aggfunc = 'sum'),
-	    avg_daily_msg = pd.NamedAgg('cnt_msg', aggfunc = 'mean'),
-	).reset_index()
+	# daily msg aggregation by sender, over the days each sender was active
+	sum_msg_sender = cube.sender_totals()
+	active_days = np.bincount(day_sender.col, minlength = len(cube.senders))
+	sender_index = np.flatnonzero(sum_msg_sender)
+	sender_daily_agg = pd.DataFrame({
+	    'sender': pd.Categorical.from_codes(sender_index, cube.senders),
+	    'sum_msg': sum_msg_sender[sender_index],
+	    'avg_daily_msg': sum_msg_sender[sender_index] / active_days[sender_index],
+	})
 
-	# avg msg by day of week & hour
-	dow_hour_agg = full_day_dow_hour_agg.groupby(['dow', 'hour']).agg(
-	    avg_msg = pd.NamedAgg('cnt_msg', aggfunc = 'mean')
-	).reset_index()
+	# avg msg by day of week & hour, hours with no message included
+	dow_hour_agg = cube.dow_hour_frame()
 
 	# weekly summarize
 	weekly_sum = agg_day.groupby('week', as_index = False).agg(
@@ -95,7 +216,7 @@ def general_aggregation(chat_df):
 	)
 
 	# aggregation to be displayed as cards
-	sum_msg = agg_day_sender['cnt_msg'].sum()
+	sum_msg = sum_msg_sender.sum()
 	daily_avg = agg_day['cnt_msg'].mean()
 	hourly_avg = agg_day_dow_hour['cnt_msg'].mean()
 	min_date = agg_day['date'].min().strftime('%d-%m-%Y')
@@ -106,9 +227,15 @@ def general_aggregation(chat_df):
 
 	return min_date, max_date, sum_msg, sender_daily_agg, daily_avg, active_days, interval_max_min, active_days_pct, weekly_sum, agg_day_dow_hour, dow_hour_agg, agg_day
 
-@st.experimental_singleton(show_spinner=False)
-def plot_sender_pie(sender_daily_agg):
-	sender_pie = alt.Chart(sender_daily_agg).mark_arc(innerRadius=50).encode(
+@cached
+def plot_sender_pie(sender_daily_agg, senders):
+	# senders not shown are one slice
+	sender_sum = sender_rows(sender_daily_agg, senders)[['sender', 'sum_msg']]
+	others = sender_daily_agg.loc[~sender_daily_agg['sender'].isin(senders), 'sum_msg'].sum()
+	if others > 0:
+	    sender_sum = pd.concat([sender_sum, pd.DataFrame({'sender': ['Others'], 'sum_msg': [others]})], ignore_index = True)
+
+	sender_pie = alt.Chart(sender_sum).mark_arc(innerRadius=50).encode(
 	    theta=alt.Theta(field="sum_msg", type="quantitative"),
 	    color=alt.Color(field="sender", type="nominal"),
 	    tooltip=['sender', 'sum_msg']
@@ -116,10 +243,12 @@ def plot_sender_pie(sender_daily_agg):
 
 	return sender_pie
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_weekly_sum(weekly_sum):
 	# Plot weekly
-	weekly_sum['week'] = pd.to_datetime(weekly_sum['week'])
+	weekly_sum = weekly_sum.assign(week = pd.to_datetime(weekly_sum['week']))
+	# long chats are downsampled to what the chart can show
+	weekly_sum = chartdata.downsample(weekly_sum, 'week', 'cnt_msg', chartdata.point_budget())
 
 	brush = alt.selection(type='interval', encodings=['x'])
 
@@ -140,23 +269,30 @@ def plot_weekly_sum(weekly_sum):
 	    brush
 	)
 
+	# average over the weeks the kept points stand for
 	msg_line = alt.Chart(weekly_sum).mark_rule(color='firebrick').encode(
-	    y='mean(cnt_msg):Q',
+	    y='avg_msg:Q',
 	    size=alt.SizeValue(3)
 	).transform_filter(
 	    brush
+	).transform_aggregate(
+	    sum_msg='sum(bucket_sum)',
+	    cnt_week='sum(bucket_cnt)'
+	).transform_calculate(
+	    avg_msg='datum.sum_msg / datum.cnt_week'
 	)
 
 	weekly_sum_alt = alt.layer(msg_timeseries, msg_line)
 
 	return weekly_sum_alt
 
-@st.experimental_singleton(show_spinner=False)
-def dow_aggregation(agg_day_dow_hour):
+@cached
+def dow_aggregation(cube):
+	# dist plot
+	dow_boxplot = cube.day_frame()[['date', 'dow', 'cnt_msg']]
+
 	# most active days
-	sum_dow = agg_day_dow_hour.groupby(['date', 'dow']).agg(
-	    cnt_msg = pd.NamedAgg('cnt_msg', aggfunc = 'sum')
-	).groupby('dow').agg(
+	sum_dow = dow_boxplot.groupby('dow').agg(
 	    avg_msg = pd.NamedAgg('cnt_msg', aggfunc = 'mean'),
 	    sum_msg = pd.NamedAgg('cnt_msg', aggfunc = 'sum')
 	).reset_index()
@@ -171,14 +307,9 @@ def dow_aggregation(agg_day_dow_hour):
 	highest_avg_dow = dow_dict[sum_dow.nlargest(1, 'avg_msg')['dow'].item()]
 	lowest_avg_dow = dow_dict[sum_dow.nsmallest(1, 'avg_msg')['dow'].item()]
 
-	# dist plot
-	dow_boxplot = agg_day_dow_hour.groupby(['date', 'dow']).agg(
-	    cnt_msg = pd.NamedAgg('cnt_msg', aggfunc = 'sum')
-	).reset_index()
-
 	return sum_dow, max_pct_cumsum_dow, days_pareto_dow, highest_avg_dow, lowest_avg_dow, dow_boxplot
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_dow_sum(sum_dow):
 	brush = alt.selection(type='interval', encodings=['x'])
 
@@ -193,15 +324,12 @@ def plot_dow_sum(sum_dow):
 
 	return bars
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_dow_dist(dow_boxplot):
-	dow_boxplot['date'] = pd.to_datetime(dow_boxplot['date'])
+	# densities are computed here, not from every day in the browser
+	dow_density = chartdata.density(dow_boxplot, 'cnt_msg', 'dow', chartdata.point_budget(300))
 
-	dow_dist_plot = alt.Chart(dow_boxplot).transform_density(
-	    'cnt_msg',
-	    as_=['cnt_msg', 'density'],
-	    groupby=['dow']
-	).mark_area().encode(
+	dow_dist_plot = alt.Chart(dow_density).mark_area().encode(
 	    alt.X('cnt_msg:Q'),
 	    alt.Y('density:Q', title = None),
 	    alt.Row('dow:N'),
@@ -213,13 +341,10 @@ def plot_dow_dist(dow_boxplot):
 
 	return dow_dist_plot
 
-@st.experimental_singleton(show_spinner=False)
-def hour_aggregation(agg_day_dow_hour):
+@cached
+def hour_aggregation(cube):
 	# most active hour
-	avg_hour = agg_day_dow_hour.groupby('hour').agg(
-	    avg_msg = pd.NamedAgg('cnt_msg', aggfunc = 'mean'),
-	    sum_msg = pd.NamedAgg('cnt_msg', aggfunc = 'sum'),
-	).reset_index()
+	avg_hour = cube.hour_frame()
 
 	avg_hour['pct_msg'] = avg_hour['sum_msg'] / avg_hour['sum_msg'].sum()
 	avg_hour['pct_msg_cumsum'] = avg_hour.sort_values(by = 'pct_msg', ascending = False)['pct_msg'].cumsum()
@@ -234,25 +359,23 @@ def hour_aggregation(agg_day_dow_hour):
 
 	return max_pct_cumsum_hour, cnt_pareto_hour, highest_avg_hour, lowest_avg_hour, peak_hour_list
 
-@st.experimental_singleton(show_spinner=False)
-def plot_hour_line(agg_day_dow_hour):
-	mean_hour = agg_day_dow_hour.groupby('hour').agg(
-	    sum_msg = pd.NamedAgg('cnt_msg', aggfunc = 'mean')
-	).reset_index()
+@cached
+def plot_hour_line(cube):
+	mean_hour = cube.hour_frame()[['hour', 'avg_msg']]
 
 	brush = alt.selection(type='interval', encodings=['x'])
 
 	mean_timeseries = alt.Chart(mean_hour).mark_line(point=True).encode(
 	    x='hour:O',
-	    y='sum_msg:Q',
-	    tooltip=['hour', 'sum_msg'],
+	    y='avg_msg:Q',
+	    tooltip=['hour', 'avg_msg'],
 	    opacity=alt.condition(brush, alt.OpacityValue(1), alt.OpacityValue(0.7)),
 	).add_selection(
 	    brush
 	)
 
 	avg_line = alt.Chart(mean_hour).mark_rule(color='firebrick').encode(
-	    y='mean(sum_msg):Q',
+	    y='mean(avg_msg):Q',
 	    size=alt.SizeValue(3)
 	).transform_filter(
 	    brush
@@ -262,7 +385,7 @@ def plot_hour_line(agg_day_dow_hour):
 
 	return hour_line
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_dow_hour_heatmap(dow_hour_agg):	
 	dow_hour_heatmap = alt.Chart(dow_hour_agg).mark_rect().encode(
 	    x='hour:O',
@@ -275,10 +398,10 @@ def plot_dow_hour_heatmap(dow_hour_agg):
 
 	return dow_hour_heatmap
 
-@st.experimental_singleton(show_spinner=False)
-def month_aggregation(agg_day):
+@cached
+def month_aggregation(cube):
 	# most active month
-	avg_month = agg_day.groupby('month').agg(
+	avg_month = cube.day_frame().groupby('month', observed = True).agg(
 	    avg_msg = pd.NamedAgg('cnt_msg', aggfunc = 'mean'),
 	    sum_msg = pd.NamedAgg('cnt_msg', aggfunc = 'sum'),
 	).reset_index()
@@ -296,7 +419,7 @@ def month_aggregation(agg_day):
 
 	return max_pct_cumsum_month, cnt_pareto_month, len_pareto_month, len_active_month, pct_pareto_month
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_month_heatmap(agg_day):
 	agg_day_heatmap = agg_day[agg_day['date'] >= agg_day['date'].max() - relativedelta(years = 1)]
 	
@@ -315,31 +438,30 @@ def plot_month_heatmap(agg_day):
 
 	return month_heatmap
 
-@st.experimental_singleton(show_spinner=False)
-def gap_aggregation(chat_df):
-	# create dataframe of replies between two users
-	gap_analysis_dict = {
-	    'timestamp': [],
-	    'sender': []
-	}
-
-	for i in range(1, len(chat_df)):
-	    prev_sender = chat_df['sender'].iloc[i-1]
-	    sender = chat_df['sender'].iloc[i]
-	    
-	    if sender != prev_sender:
-	        gap_analysis_dict['timestamp'].append(chat_df['timestamp'].iloc[i])
-	        gap_analysis_dict['sender'].append(chat_df['sender'].iloc[i])
+@cached
+def gap_aggregation(chat_df, senders):
+	# turns: the first message, then every message whose sender differs from
+	# the previous message's. events have no sender and don't take a turn
+	messages = chat_df[chat_df['sender'].notna()]
+	sender = pd.Categorical(messages['sender'])
+	timestamp = messages['timestamp'].to_numpy(dtype = 'datetime64[ns]')
+	turn = np.flatnonzero(np.diff(sender.codes, prepend = -1) != 0)
 
-	gap_analysis_df = pd.DataFrame(gap_analysis_dict)
+	gap_analysis_df = pd.DataFrame({
+	    'timestamp': timestamp[turn],
+	    'sender': sender[turn],
+	})
 
 	# add day, week, hour column
-	gap_analysis_df['day'] = gap_analysis_df['timestamp'].dt.date
-	gap_analysis_df['week'] = gap_analysis_df['day'] - pd.to_timedelta(gap_analysis_df['timestamp'].dt.dayofweek, unit='d')
-	gap_analysis_df['hour'] = gap_analysis_df['timestamp'].dt.hour
+	calendar = calendar_columns(gap_analysis_df['timestamp'])
+	gap_analysis_df['day'] = calendar['date']
+	gap_analysis_df['week'] = calendar['week']
+	gap_analysis_df['hour'] = calendar['hour']
 
-	# generate delta in second
-	gap_analysis_df['time_delta'] = gap_analysis_df['timestamp'].diff(1).dt.total_seconds()
+	# generate delta in second, from the previous reply
+	time_delta = np.full(len(turn), np.nan)
+	time_delta[1:] = np.diff(timestamp[turn].astype(np.int64)) / 1e9
+	gap_analysis_df['time_delta'] = time_delta
 
 	# overall median gap
 	overall_median_gap = gap_analysis_df['time_delta'].median()
@@ -349,21 +471,24 @@ def gap_aggregation(chat_df):
 	    median_delta_sec = pd.NamedAgg('time_delta', aggfunc = 'median')
 	)
 
-	# overall avg gap by sender
-	gap_agg_sender = gap_analysis_df.groupby('sender', as_index = False).agg(
+	# overall avg gap by sender, every sender in one grouped pass
+	gap_agg_sender = gap_analysis_df.groupby('sender', as_index = False, observed = True).agg(
 	    avg_delta_sec = pd.NamedAgg('time_delta', aggfunc = 'mean'),
 	    median_delta_sec = pd.NamedAgg('time_delta', aggfunc = 'median')
 	)
+	gap_agg_sender = sender_rows(gap_agg_sender, senders)
 
 	sender_1_avg_gap = gap_agg_sender['avg_delta_sec'][0]
 	sender_2_avg_gap = gap_agg_sender['avg_delta_sec'][1]
 
 	return gap_analysis_df, gap_agg_week, gap_agg_sender, sender_1_avg_gap, sender_2_avg_gap, overall_median_gap
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_weekly_gap_timeseries(gap_agg_week):
 	# Plot
-	gap_agg_week['week'] = pd.to_datetime(gap_agg_week['week'])
+	gap_agg_week = gap_agg_week.assign(week = pd.to_datetime(gap_agg_week['week']))
+	# long chats are downsampled to what the chart can show
+	gap_agg_week = chartdata.downsample(gap_agg_week, 'week', 'median_delta_sec', chartdata.point_budget())
 
 	brush = alt.selection(type='interval', encodings=['x'])
 
@@ -381,61 +506,38 @@ def plot_weekly_gap_timeseries(gap_agg_week):
 	    brush
 	)
 
+	# average over the weeks the kept points stand for
 	gap_line = alt.Chart(gap_agg_week).mark_rule(color='firebrick').encode(
-	    y='mean(median_delta_sec):Q',
+	    y='avg_delta_sec:Q',
 	    size=alt.SizeValue(3)
 	).transform_filter(
 	    brush
+	).transform_aggregate(
+	    sum_delta_sec='sum(bucket_sum)',
+	    cnt_week='sum(bucket_cnt)'
+	).transform_calculate(
+	    avg_delta_sec='datum.sum_delta_sec / datum.cnt_week'
 	)
 
 	weekly_gap_timeseries = alt.layer(gap_time_series, gap_line)
 
 	return weekly_gap_timeseries
 
-@st.experimental_singleton(show_spinner=False)
-def gap_xplot_aggregation(gap_analysis_df):
-	# create aggregation of median gap by sender
-	sender_name = []
-	sender_xplot_dict = {}
-	median_gap_list_xplot = []
-
-	for sender in gap_analysis_df['sender'].unique().tolist():
-	    # save sender name
-	    sender_name.append(sender)
-	    
-	    # subset one sender
-	    gap_analysis_sender = gap_analysis_df[gap_analysis_df['sender'] == sender]
-
-	    # do aggregation
-	    gap_sender_summary = gap_analysis_sender.groupby(['sender', 'hour'], as_index = False).agg(
-	        median_delta_sec = pd.NamedAgg('time_delta', aggfunc = 'median')
-	    )
-	    
-	    # get median gap
-	    median_gap_list_xplot.append(np.median(gap_sender_summary['median_delta_sec']))
-	    
-	    # drop sender column
-	    gap_sender_summary = gap_sender_summary.drop('sender', axis = 1)
-	    
-	    # rename column
-	    gap_sender_summary = gap_sender_summary.rename(columns = {'median_delta_sec': sender.lower().split()[0] + '_median_delta_sec'})
-	    
-	    # put into dictionary
-	    sender_xplot_dict[sender] = gap_sender_summary
-	    
-	# i got this from ChatGPT.... it is a wonderful tool....
-	# create an empty list to store the joined DataFrames
-	gap_xplot_list = []
-
-	# loop over the DataFrames in the dictionary
-	for name, df in sender_xplot_dict.items():
-	    # join the DataFrame with the first element in the list
-	    if len(gap_xplot_list) == 0:
-	        gap_xplot_list.append(df)
-	    else:
-	        gap_xplot_list.append(gap_xplot_list[0].merge(df, on = 'hour'))
-
-	gap_xplot = gap_xplot_list[-1]
+@cached
+def gap_xplot_aggregation(gap_analysis_df, senders):
+	# median gap by sender & hour in one grouped pass, one column per compared sender
+	gap_sender_hour = gap_analysis_df.groupby(['sender', 'hour'], observed = True)['time_delta'].median()
+	sender_name = list(senders[:2])
+	median_gap_list_xplot = gap_sender_hour.groupby(level = 'sender', observed = True).median()[sender_name].tolist()
+
+	# hours every sender replied in
+	gap_xplot = gap_sender_hour.unstack('sender')[sender_name].dropna()
+	# first names, full names when the compared senders share one
+	column_name = [sender.lower().split()[0] for sender in sender_name]
+	if column_name[0] == column_name[1]:
+	    column_name = [sender.lower().replace(' ', '_') for sender in sender_name]
+	gap_xplot.columns = [name + '_median_delta_sec' for name in column_name]
+	gap_xplot = gap_xplot.reset_index()
 
 	sender_1_name = sender_name[0]
 	sender_2_name = sender_name[1]
@@ -446,11 +548,11 @@ def gap_xplot_aggregation(gap_analysis_df):
 	sender_1_median_gap = median_gap_list_xplot[0]
 	sender_2_median_gap = median_gap_list_xplot[1]
 
-	gap_xplot['ampm'] = ['AM' if hour < 12 else 'PM' for hour in gap_xplot['hour']]
+	gap_xplot['ampm'] = np.where(gap_xplot['hour'] < 12, 'AM', 'PM')
 
 	return gap_xplot, sender_1_name, sender_2_name, sender_1_col, sender_2_col, sender_1_median_gap, sender_2_median_gap
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def gap_t_test(gap_analysis_df, sender_1_name, sender_2_name, sender_1_avg_gap, sender_2_avg_gap):
 	# pct difference of avg
 	pct_gap_diff = (sender_2_avg_gap / sender_1_avg_gap) - 1
@@ -473,7 +575,7 @@ def gap_t_test(gap_analysis_df, sender_1_name, sender_2_name, sender_1_avg_gap,
 
 	return gap_difference_note, gap_stat_test_note
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_gap_xplot(gap_xplot, sender_1_col, sender_2_col, sender_1_median_gap, sender_2_median_gap):
 	# XPlot
 	gap_xplot_fig = alt.Chart(gap_xplot).mark_circle(size=60).encode(
@@ -509,7 +611,7 @@ def plot_gap_xplot(gap_xplot, sender_1_col, sender_2_col, sender_1_median_gap, s
 
 	return gap_xplot_plot
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def fastslow_gap(gap_xplot, sender_1_col, sender_2_col, sender_1_median_gap, sender_2_median_gap):
 	# check fast & slow hours
 	both_fast = []
@@ -529,37 +631,40 @@ def fastslow_gap(gap_xplot, sender_1_col, sender_2_col, sender_1_median_gap, sen
 
 	return both_fast, sender_1_fast, sender_2_fast, both_slow
 
-@st.experimental_singleton(show_spinner=False)
+@cached
+def reply_aggregation(gap_analysis_df):
+	# who replies to whom: every turn replies to the sender of the previous one
+	return ReplyGraph.from_turns(gap_analysis_df['sender'], gap_analysis_df['time_delta'])
+
+@cached
+def plot_reply_heatmap(reply_graph, senders):
+	# pairs with the most replies when there are too many to draw
+	reply_df = chartdata.cap(reply_graph.frame(senders), 'cnt_reply')
+
+	reply_heatmap = alt.Chart(reply_df).mark_rect().encode(
+	    x = alt.X('replied_to:N', sort = list(senders), title = 'Replying to'),
+	    y = alt.Y('sender:N', sort = list(senders), title = 'Sender'),
+	    color = alt.Color('cnt_reply:Q', title = '# of replies'),
+	    tooltip = ['sender', 'replied_to', 'cnt_reply', 'median_delta_sec']
+	)
+
+	return reply_heatmap
+
+@cached
 def emoji_aggregation(chat_df):
-	# expand emoji from list
-	expanded = {
-	    'timestamp': [],
-	    'date': [],
-	    'month': [],
-	    'sender': [],
-	    'emoji': []
-	}
-
-	for timestamp, date, month, sender, emoji_list in zip(chat_df['timestamp'], chat_df['date'], chat_df['month'], chat_df['sender'], chat_df['emoji']):
-	    for emoji in emoji_list:
-	        expanded['timestamp'].append(timestamp)
-	        expanded['date'].append(date)
-	        expanded['month'].append(month)
-	        expanded['sender'].append(sender)
-	        expanded['emoji'].append(emoji)
-	        
-	expanded_df = pd.DataFrame(expanded)
+	chat_df = with_features(chat_df, ('emoji',))
+
+	# one row per emoji, from the flat emoji codes & per message offsets
+	expanded_df = exploded.explode(chat_df, 'emoji', ['date', 'month', 'sender'])
 
 	# aggregation
-	overall_cnt = expanded_df.groupby(['emoji'], as_index = False).agg(
-	    cnt = pd.NamedAgg('emoji', aggfunc = 'count')
-	)
+	overall_cnt = exploded.value_counts(chat_df['emoji'], 'emoji')
 
-	daily_emoji_cnt = expanded_df.groupby(['date', 'sender', 'emoji'], as_index = False).agg(
+	daily_emoji_cnt = expanded_df.groupby(['date', 'sender', 'emoji'], as_index = False, observed = True).agg(
 	    cnt = pd.NamedAgg('emoji', aggfunc = 'count')
 	)
 
-	monthly_emoji_cnt = expanded_df.groupby(['month', 'sender', 'emoji'], as_index = False).agg(
+	monthly_emoji_cnt = expanded_df.groupby(['month', 'sender', 'emoji'], as_index = False, observed = True).agg(
 	    cnt = pd.NamedAgg('emoji', aggfunc = 'count')
 	)
 
@@ -569,7 +674,7 @@ def emoji_aggregation(chat_df):
 
 	return overall_top_10_emoji, daily_emoji_cnt, monthly_emoji_cnt, top_emoji
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_emoji_bar(overall_top_10_emoji):
 	# Plot top emoji
 	bar_overall_emoji = alt.Chart(overall_top_10_emoji).mark_bar().encode(
@@ -592,39 +697,38 @@ def plot_emoji_bar(overall_top_10_emoji):
 
 	return emoji_bar
 
-@st.experimental_singleton(show_spinner=False)
-def fav_emoji_by_sender(monthly_emoji_cnt):
-	month_list = monthly_emoji_cnt['month'].unique()
-	sender_list = monthly_emoji_cnt['sender'].unique()
-	fav_emoji_list = []
+@cached
+def fav_emoji_by_sender(monthly_emoji_cnt, senders):
+	# most sent emoji of every month & shown sender
+	monthly_emoji_cnt = monthly_emoji_cnt[monthly_emoji_cnt['sender'].isin(senders)]
+	fav_emoji_df = top_k(monthly_emoji_cnt, ['month', 'sender'], 'cnt', 1).reset_index(drop = True)
 
-	for month in month_list:
-	    for sender in sender_list:
-	        fav_emoji = monthly_emoji_cnt[(monthly_emoji_cnt['month'] == month) & (monthly_emoji_cnt['sender'] == sender)].nlargest(1, 'cnt')
-	        fav_emoji_list.append(fav_emoji)
+	# favorite of the compared senders in the first & last month they sent emoji
+	fav_emoji_sender = fav_emoji_df.groupby('sender', observed = True)['emoji']
+	first_month_emoji = fav_emoji_sender.first()
+	last_month_emoji = fav_emoji_sender.last()
 
-	fav_emoji_df = pd.concat(fav_emoji_list).reset_index(drop = True)
+	sender_1_first_month = senders[0]
+	sender_2_first_month = senders[1]
+	emoji_1_first_month = first_month_emoji[senders[0]]
+	emoji_2_first_month = first_month_emoji[senders[1]]
 
-	sender_1_first_month = fav_emoji_df.iloc[0]['sender']
-	sender_2_first_month = fav_emoji_df.iloc[1]['sender']
-	emoji_1_first_month = fav_emoji_df.iloc[0]['emoji']
-	emoji_2_first_month = fav_emoji_df.iloc[1]['emoji']
-
-	sender_1_last_month = fav_emoji_df.iloc[-2]['sender']
-	sender_2_last_month = fav_emoji_df.iloc[-1]['sender']
-	emoji_1_last_month = fav_emoji_df.iloc[-2]['emoji']
-	emoji_2_last_month = fav_emoji_df.iloc[-1]['emoji']
+	sender_1_last_month = senders[0]
+	sender_2_last_month = senders[1]
+	emoji_1_last_month = last_month_emoji[senders[0]]
+	emoji_2_last_month = last_month_emoji[senders[1]]
 
 
 	return fav_emoji_df, sender_1_first_month, sender_2_first_month, emoji_1_first_month, emoji_2_first_month, sender_1_last_month, sender_2_last_month, emoji_1_last_month, emoji_2_last_month
 
-@st.experimental_singleton(show_spinner=False)
-def love_t_test(daily_emoji_cnt):
+@cached
+def love_t_test(daily_emoji_cnt, senders):
 	love_df = daily_emoji_cnt[daily_emoji_cnt['emoji'] == '❤️']
 
-	love_daily_avg = love_df.groupby('sender').agg(
+	love_daily_avg = love_df.groupby('sender', observed = True).agg(
 	    avg = pd.NamedAgg('cnt', aggfunc = 'mean')
 	).reset_index()
+	love_daily_avg = sender_rows(love_daily_avg, senders)
 
 	sender_1_love = love_daily_avg['sender'][0]
 	sender_2_love = love_daily_avg['sender'][1]
@@ -653,42 +757,27 @@ def love_t_test(daily_emoji_cnt):
 
 	return love_daily_avg, love_difference_note, love_stat_test_note
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def link_aggregation(chat_df):
-	expanded_domain = {
-	    'timestamp': [],
-	    'date': [],
-	    'month': [],
-	    'sender': [],
-	    'domain': []
-	}
-
-	for timestamp, date, month, sender, domain_list in zip(chat_df['timestamp'], chat_df['date'], chat_df['month'], chat_df['sender'], chat_df['domain']):
-	    for domain in domain_list:
-	        expanded_domain['timestamp'].append(timestamp)
-	        expanded_domain['date'].append(date)
-	        expanded_domain['month'].append(month)
-	        expanded_domain['sender'].append(sender)
-	        expanded_domain['domain'].append(domain)
-	        
-	expanded_df_domain = pd.DataFrame(expanded_domain)
+	chat_df = with_features(chat_df, ('domain',))
+
+	# one row per domain, from the flat domain codes & per message offsets
+	expanded_df_domain = exploded.explode(chat_df, 'domain', ['date', 'month', 'sender'])
 
 	# aggregation
-	overall_cnt_domain = expanded_df_domain.groupby(['domain'], as_index = False).agg(
-	    cnt = pd.NamedAgg('domain', aggfunc = 'count')
-	)
+	overall_cnt_domain = exploded.value_counts(chat_df['domain'], 'domain')
 
 	overall_top_10_domain = overall_cnt_domain.nlargest(10, 'cnt').reset_index(drop = True)
 
 	top_domain = overall_top_10_domain.iloc[0]['domain']
 
-	sender_cnt_domain = expanded_df_domain.groupby(['sender', 'domain'], as_index = False).agg(
+	sender_cnt_domain = expanded_df_domain.groupby(['sender', 'domain'], as_index = False, observed = True).agg(
 	    cnt = pd.NamedAgg('domain', aggfunc = 'count')
 	)
 
 	return overall_top_10_domain, sender_cnt_domain, top_domain
 
-@st.experimental_singleton(show_spinner=False)
+@cached
 def plot_link_overall_bar(overall_top_10_domain):
 	# Plot top domain overall
 	bar_overall_domain = alt.Chart(overall_top_10_domain).mark_bar().encode(
@@ -711,52 +800,47 @@ def plot_link_overall_bar(overall_top_10_domain):
 
 	return link_overall_bar
 
-@st.experimental_singleton(show_spinner=False)
-def plot_link_sender_bar(sender_cnt_domain):
-	# Create top 10 domains by sender
-	sender_list_domain = sender_cnt_domain['sender'].unique()
-	fav_domain_list = []
-
-	for sender in sender_list_domain:
-	    fav_domain = sender_cnt_domain[sender_cnt_domain['sender'] == sender].nlargest(10, 'cnt')
-	    fav_domain_list.append(fav_domain)
-
-	fav_domain_df = pd.concat(fav_domain_list).reset_index(drop = True)
-
-	# Plot chart
-	domain_chart_list = []
-
-	for sender in fav_domain_df['sender'].unique():
-	    source = fav_domain_df[fav_domain_df['sender'] == sender]
-
-	    # Plot top domain
-	    bar_sender_domain = alt.Chart(source).mark_bar().encode(
-	        x = 'cnt',
-	        y = alt.Y('domain', sort=None),
-	        tooltip = ['cnt']
-	    )
-
-	    label_sender_domain = bar_sender_domain.mark_text(
-	        align='left',
-	        baseline='middle',
-	        dx=3  # Nudges text to right so it doesn't appear on top of the bar
-	    ).encode(
-	        text='cnt'
-	    ).properties(
-	        title = 'Top Domains by {sender}'.format(sender=sender)
-	    )
-	    
-	    domain_chart_list.append(alt.layer(bar_sender_domain + label_sender_domain))
-
-	return domain_chart_list
-
-@st.experimental_singleton(show_spinner=False)
-def link_t_test(chat_df):
-	chat_df['domain_cnt'] = [len(domain) for domain in chat_df['domain']]
-
-	domain_avg = chat_df.groupby('sender').agg(
+@cached
+def plot_link_sender_bar(sender_cnt_domain, senders):
+	# Create top 10 domains by shown sender
+	sender_cnt_domain = sender_cnt_domain[sender_cnt_domain['sender'].isin(senders)]
+	fav_domain_df = top_k(sender_cnt_domain, 'sender', 'cnt', 10).reset_index(drop = True)
+	fav_domain_df['sender'] = fav_domain_df['sender'].astype(object)
+
+	# Plot chart, one facet per sender instead of one chart each
+	bar_sender_domain = alt.Chart().mark_bar().encode(
+	    x = 'cnt',
+	    y = alt.Y('domain', sort=None),
+	    tooltip = ['cnt']
+	)
+
+	label_sender_domain = bar_sender_domain.mark_text(
+	    align='left',
+	    baseline='middle',
+	    dx=3  # Nudges text to right so it doesn't appear on top of the bar
+	).encode(
+	    text='cnt'
+	)
+
+	link_sender_bar = alt.layer(bar_sender_domain, label_sender_domain, data = fav_domain_df).facet(
+	    facet = alt.Facet('sender:N', sort = list(senders), header = alt.Header(labelExpr = "'Top Domains by ' + datum.value", title = None)),
+	    columns = 2
+	).resolve_scale(
+	    y = 'independent'
+	)
+
+	return link_sender_bar
+
+@cached
+def link_t_test(chat_df, senders):
+	chat_df = with_features(chat_df, ('domain',))
+
+	chat_df = chat_df.assign(domain_cnt = exploded.counts(chat_df['domain']))
+
+	domain_avg = chat_df.groupby('sender', observed = True).agg(
 	    avg = pd.NamedAgg('domain_cnt', aggfunc = 'mean')
 	).reset_index()
+	domain_avg = sender_rows(domain_avg, senders)
 
 	sender_1_domain = domain_avg['sender'][0]
 	sender_2_domain = domain_avg['sender'][1]
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Incremental re-ingest of newer exports of a chat.
+
+A newer export of a chat starts with the lines of the older one. Uploads
+are fingerprinted by blocks of BLOCK_LINES lines: when every full block of
+an export parsed before leads the upload, only the lines from its last
+block on are parsed. Those are appended to its chat_df, minus the messages
+it already has, matched by (timestamp, sender, body hash).
+
+An appended chat_df remembers the chat_df it extends (base_of), so the
+activity cube and the extracted features of the older export are extended
+with the new rows instead of being rebuilt. The older chat_df is held until
+the activity cube is derived: one loaded from the disk cache is referenced
+by nothing else.
+"""
+import hashlib
+import weakref
+from collections import OrderedDict
+from itertools import islice
+import pandas as pd
+import chat_cache
+import schema
+from chatline import FEATURES
+
+BLOCK_LINES = 1024
+# exports remembered in memory, the chat_df themselves are only weakly
+# referenced, they live as long as the pipeline cache keeps them
+MAX_EXPORTS = 64
+
+# (first block hash, features) -> (block hashes, weakref to chat_df)
+EXPORTS = OrderedDict()
+# id of an appended chat_df -> callable returning the chat_df it extends,
+# holding it until release_base, then a weakref
+BASES = {}
+
+
+def block_hashes(lines):
+    """
+    Hash of every full block of BLOCK_LINES lines, in order. The last,
+    partial block is left out, a newer export may have more lines in it.
+    """
+    lines = iter(lines)
+    hashes = []
+    while True:
+        block = list(islice(lines, BLOCK_LINES))
+        if len(block) < BLOCK_LINES:
+            return tuple(hashes)
+        hashes.append(hashlib.blake2b("\n".join(block).encode('utf-8', 'surrogatepass'), digest_size=16).hexdigest())
+
+
+def find_base(blocks, features):
+    """
+    The chat_df of an export parsed before with the same features, whose
+    full blocks all lead blocks, and the line to parse the upload from.
+    (None, 0) if there is none.
+    """
+    if not blocks:
+        return None, 0
+
+    candidates = []
+    entry = EXPORTS.get((blocks[0], frozenset(features)))
+    if entry is not None:
+        base_blocks, ref = entry
+        candidates.append((base_blocks, ref))
+    # cached chats have every feature extracted
+    if chat_cache.enabled() and set(features) == set(FEATURES):
+        key, base_blocks = chat_cache.load_blocks(blocks[0])
+        if key is not None:
+            candidates.append((base_blocks, lambda: chat_cache.load(key)))
+
+    for base_blocks, load in candidates:
+        if not base_blocks or blocks[:len(base_blocks)] != base_blocks:
+            continue
+        base_df = load()
+        if base_df is not None:
+            # parse again from the last common block, the messages running
+            # over its end are dropped by append
+            return base_df, (len(base_blocks) - 1) * BLOCK_LINES
+
+    return None, 0
+
+
+def remember(blocks, features, chat_df):
+    if not blocks:
+        return
+
+    key = (blocks[0], frozenset(features))
+    EXPORTS[key] = (blocks, weakref.ref(chat_df))
+    EXPORTS.move_to_end(key)
+    while len(EXPORTS) > MAX_EXPORTS:
+        EXPORTS.popitem(last=False)
+
+
+def row_keys(chat_df):
+    """
+    Hash of the timestamp, sender and body of every message. Frames without
+    bodies keep it in a 'row_key' column.
+    """
+    if 'row_key' in chat_df:
+        return chat_df['row_key'].to_numpy()
+    return pd.util.hash_pandas_object(chat_df[['timestamp', 'sender', 'body']], index=False).to_numpy()
+
+
+def append(base_df, tail_df):
+    """
+    base_df followed by the messages of tail_df it doesn't have, tail_df
+    starting within the last messages of base_df.
+    """
+    duplicate = pd.Series(False, index=tail_df.index)
+    if len(tail_df):
+        window = base_df[base_df['timestamp'] >= tail_df['timestamp'].min()]
+        tail_keys = pd.Series(row_keys(tail_df), index=tail_df.index)
+
+        # identical messages (a burst of "ok" within a minute) are matched
+        # one for one, so the new ones are kept
+        seen = pd.Series(row_keys(window)).value_counts()
+        occurrence = tail_keys.groupby(tail_keys).cumcount()
+        duplicate = occurrence < seen.reindex(tail_keys).fillna(0).to_numpy()
+
+    chat_df = schema.concat([base_df, tail_df[~duplicate]])
+
+    BASES[id(chat_df)] = lambda: base_df
+    weakref.finalize(chat_df, BASES.pop, id(chat_df), None)
+    return chat_df
+
+
+def base_of(chat_df):
+    """
+    The chat_df whose rows chat_df starts with, if it was appended to one
+    that is still alive.
+    """
+    ref = BASES.get(id(chat_df))
+    return ref() if ref is not None else None
+
+
+def release_base(chat_df):
+    """
+    Only weakly reference the chat_df chat_df extends, once what is derived
+    from it exists.
+    """
+    base_df = base_of(chat_df)
+    if base_df is not None:
+        BASES[id(chat_df)] = weakref.ref(base_df)
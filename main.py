@@ -1,5 +1,7 @@
 import streamlit as st
 from helper import *
+import memo
+import stages
 
 # page config
 st.set_page_config(
@@ -14,8 +16,8 @@ st.set_page_config(
 
 # sidebar title & disclaimer
 st.sidebar.header("💌 WhatsApp Chat Analysis")
-st.sidebar.caption("Tap the contact's name in an individual WhatsApp chat, then tap 'Export Chat' to get the chat history in TXT.")
-st.sidebar.caption("No data is stored by the app. It only reads the emojis, links, and metadata (sender and timestamp) from your messages for the visualization purposes. Tested for individual chat only. Use at your own risk.")
+st.sidebar.caption("Tap the contact or group name in a WhatsApp chat, then tap 'Export Chat' to get the chat history in TXT.")
+st.sidebar.caption("No data is stored by the app. It only reads the emojis, links, and metadata (sender and timestamp) from your messages for the visualization purposes. Works for individual and group chats. Use at your own risk.")
 
 # create a file uploader widget in the sidebar
 chat_txt = st.sidebar.file_uploader("Upload a chat text file", type = 'txt', label_visibility = 'collapsed')
@@ -35,58 +37,90 @@ selected_tab = st.sidebar.radio(
     )
 
 
+# pipeline stages: outputs, function, inputs
+# chat_df, cube & senders are computed for every tab, see below
+STAGES = [
+    # general info
+    stages.Stage(('min_date', 'max_date', 'sum_msg', 'sender_daily_agg', 'daily_avg', 'active_days', 'interval_max_min', 'active_days_pct', 'weekly_sum', 'agg_day_dow_hour', 'dow_hour_agg', 'agg_day'), general_aggregation, ('cube',)),
+    stages.Stage(('sender_pie',), plot_sender_pie, ('sender_daily_agg', 'senders')),
+    stages.Stage(('weekly_sum_alt',), plot_weekly_sum, ('weekly_sum',)),
+
+    # dow
+    stages.Stage(('sum_dow', 'max_pct_cumsum_dow', 'days_pareto_dow', 'highest_avg_dow', 'lowest_avg_dow', 'dow_boxplot'), dow_aggregation, ('cube',)),
+    stages.Stage(('dow_sum_plot',), plot_dow_sum, ('sum_dow',)),
+    stages.Stage(('dow_dist_plot',), plot_dow_dist, ('dow_boxplot',)),
+
+    # hour
+    stages.Stage(('max_pct_cumsum_hour', 'cnt_pareto_hour', 'highest_avg_hour', 'lowest_avg_hour', 'peak_hour_list'), hour_aggregation, ('cube',)),
+    stages.Stage(('hour_line',), plot_hour_line, ('cube',)),
+    stages.Stage(('dow_hour_heatmap',), plot_dow_hour_heatmap, ('dow_hour_agg',)),
+
+    # month
+    stages.Stage(('max_pct_cumsum_month', 'cnt_pareto_month', 'len_pareto_month', 'len_active_month', 'pct_pareto_month'), month_aggregation, ('cube',)),
+    stages.Stage(('month_heatmap',), plot_month_heatmap, ('agg_day',)),
+
+    # gap
+    stages.Stage(('gap_analysis_df', 'gap_agg_week', 'gap_agg_sender', 'sender_1_avg_gap', 'sender_2_avg_gap', 'overall_median_gap'), gap_aggregation, ('chat_df', 'senders')),
+    stages.Stage(('weekly_gap_timeseries',), plot_weekly_gap_timeseries, ('gap_agg_week',)),
+    stages.Stage(('overall_gap_min', 'overall_gap_sec'), lambda overall_median_gap: divmod(overall_median_gap, 60), ('overall_median_gap',)),
+    stages.Stage(('gap_xplot', 'sender_1_name', 'sender_2_name', 'sender_1_col', 'sender_2_col', 'sender_1_median_gap', 'sender_2_median_gap'), gap_xplot_aggregation, ('gap_analysis_df', 'senders')),
+    stages.Stage(('gap_difference_note', 'gap_stat_test_note'), gap_t_test, ('gap_analysis_df', 'sender_1_name', 'sender_2_name', 'sender_1_avg_gap', 'sender_2_avg_gap')),
+    stages.Stage(('gap_xplot_plot',), plot_gap_xplot, ('gap_xplot', 'sender_1_col', 'sender_2_col', 'sender_1_median_gap', 'sender_2_median_gap')),
+    stages.Stage(('both_fast', 'sender_1_fast', 'sender_2_fast', 'both_slow'), fastslow_gap, ('gap_xplot', 'sender_1_col', 'sender_2_col', 'sender_1_median_gap', 'sender_2_median_gap')),
+    stages.Stage(('reply_graph',), reply_aggregation, ('gap_analysis_df',)),
+    stages.Stage(('reply_heatmap',), plot_reply_heatmap, ('reply_graph', 'senders')),
+
+    # emoji
+    stages.Stage(('overall_top_10_emoji', 'daily_emoji_cnt', 'monthly_emoji_cnt', 'top_emoji'), emoji_aggregation, ('chat_df',)),
+    stages.Stage(('emoji_bar',), plot_emoji_bar, ('overall_top_10_emoji',)),
+    stages.Stage(('fav_emoji_df', 'sender_1_first_month', 'sender_2_first_month', 'emoji_1_first_month', 'emoji_2_first_month', 'sender_1_last_month', 'sender_2_last_month', 'emoji_1_last_month', 'emoji_2_last_month'), fav_emoji_by_sender, ('monthly_emoji_cnt', 'senders')),
+    stages.Stage(('love_daily_avg', 'love_difference_note', 'love_stat_test_note'), love_t_test, ('daily_emoji_cnt', 'senders')),
+
+    # links
+    stages.Stage(('overall_top_10_domain', 'sender_cnt_domain', 'top_domain'), link_aggregation, ('chat_df',)),
+    stages.Stage(('link_overall_bar',), plot_link_overall_bar, ('overall_top_10_domain',)),
+    stages.Stage(('link_sender_bar',), plot_link_sender_bar, ('sender_cnt_domain', 'senders')),
+    stages.Stage(('domain_avg', 'link_difference_note', 'link_stat_test_note'), link_t_test, ('chat_df', 'senders')),
+]
+
 try:
     # if uploaded file is valid
     if chat_txt is not None:
 
         ### DATA READ & AGGREGATION
         # read txt file
-        chat_df = read_chat_txt(chat_txt)
-        
-        # aggregation & plot for general info
-        min_date, max_date, sum_msg, sender_daily_agg, daily_avg, active_days, interval_max_min, active_days_pct, weekly_sum, agg_day_dow_hour, dow_hour_agg, agg_day = general_aggregation(chat_df)
-        sender_pie = plot_sender_pie(sender_daily_agg)
-        weekly_sum_alt = plot_weekly_sum(weekly_sum)
-        
-        # aggregation & plot for dow
-        sum_dow, max_pct_cumsum_dow, days_pareto_dow, highest_avg_dow, lowest_avg_dow, dow_boxplot = dow_aggregation(agg_day_dow_hour)
-        dow_sum_plot = plot_dow_sum(sum_dow)
-        dow_dist_plot = plot_dow_dist(dow_boxplot)
-
-        # aggregation & plot for hour
-        max_pct_cumsum_hour, cnt_pareto_hour, highest_avg_hour, lowest_avg_hour, peak_hour_list = hour_aggregation(agg_day_dow_hour)
-        hour_line = plot_hour_line(agg_day_dow_hour)
-        dow_hour_heatmap = plot_dow_hour_heatmap(dow_hour_agg)
-
-        # aggregation & plot for month
-        max_pct_cumsum_month, cnt_pareto_month, len_pareto_month, len_active_month, pct_pareto_month = month_aggregation(agg_day)
-        month_heatmap = plot_month_heatmap(agg_day)
-
-        # aggregation & plot for gap
-        gap_analysis_df, gap_agg_week, gap_agg_sender, sender_1_avg_gap, sender_2_avg_gap, overall_median_gap = gap_aggregation(chat_df)
-        weekly_gap_timeseries = plot_weekly_gap_timeseries(gap_agg_week)
-        overall_gap_min = overall_median_gap // 60
-        overall_gap_sec = overall_median_gap % 60
-        gap_xplot, sender_1_name, sender_2_name, sender_1_col, sender_2_col, sender_1_median_gap, sender_2_median_gap = gap_xplot_aggregation(gap_analysis_df)
-        gap_difference_note, gap_stat_test_note = gap_t_test(gap_analysis_df, sender_1_name, sender_2_name, sender_1_avg_gap, sender_2_avg_gap)
-        gap_xplot_plot = plot_gap_xplot(gap_xplot, sender_1_col, sender_2_col, sender_1_median_gap, sender_2_median_gap)
-        both_fast, sender_1_fast, sender_2_fast, both_slow = fastslow_gap(gap_xplot, sender_1_col, sender_2_col, sender_1_median_gap, sender_2_median_gap)
-
-        # aggregation & plot for emoji
-        overall_top_10_emoji, daily_emoji_cnt, monthly_emoji_cnt, top_emoji = emoji_aggregation(chat_df)
-        emoji_bar = plot_emoji_bar(overall_top_10_emoji)
-        fav_emoji_df, sender_1_first_month, sender_2_first_month, emoji_1_first_month, emoji_2_first_month, sender_1_last_month, sender_2_last_month, emoji_1_last_month, emoji_2_last_month = fav_emoji_by_sender(monthly_emoji_cnt)
-        love_daily_avg, love_difference_note, love_stat_test_note = love_t_test(daily_emoji_cnt)
-
-        # aggregation & plot for links
-        overall_top_10_domain, sender_cnt_domain, top_domain = link_aggregation(chat_df)
-        link_overall_bar = plot_link_overall_bar(overall_top_10_domain)
-        link_sender_bar = plot_link_sender_bar(sender_cnt_domain)
-        domain_avg, link_difference_note, link_stat_test_note = link_t_test(chat_df)
+        # emoji & domain are extracted on demand by their aggregations
+        export_df = read_chat_txt(chat_txt, engine = 'columnar', features = ())
+
+        # restrict the dashboard to a period of the chat
+        first_date, last_date = time_index(export_df).dates()
+        period = st.sidebar.date_input("Period", value = (first_date, last_date), min_value = first_date, max_value = last_date)
+        # only the start is set while the end is being picked
+        start_date, end_date = period if len(period) == 2 else (period[0], last_date)
+        chat_df = chat_period(export_df, start_date, end_date)
+        if chat_df.empty:
+            st.write("No message was sent in the selected period")
+            st.stop()
+
+        # messages per day x hour x sender of the period, shared by every tab
+        cube = cube_period(export_df, start_date, end_date)
+
+        # group chats show their most active senders, the first two are compared
+        active_senders = top_senders(cube, len(cube.senders))
+        n_senders = len(active_senders)
+        if n_senders > 2:
+            n_senders = st.sidebar.slider("Number of senders shown", 2, n_senders, min(n_senders, 10))
+        senders = active_senders[:n_senders]
+
+        # everything below is computed on demand by the tab that displays it,
+        # once per upload, period & shown senders
+        pipeline = stages.Pipeline(STAGES, stages.session_values(st.session_state, (memo.get_fingerprint(export_df), start_date, end_date, senders)))
+        pipeline.values.update(chat_df = chat_df, cube = cube, senders = senders)
 
         ### UI
         # General
         if selected_tab == "📊 General Information":
+            min_date, max_date, sum_msg, sender_daily_agg, daily_avg, active_days, interval_max_min, active_days_pct, weekly_sum_alt, sender_pie = pipeline('min_date', 'max_date', 'sum_msg', 'sender_daily_agg', 'daily_avg', 'active_days', 'interval_max_min', 'active_days_pct', 'weekly_sum_alt', 'sender_pie')
             st.title('General Information')
             st.subheader('Total message & active days')
             col1_1, col1_2, col1_3 = st.columns(3)
@@ -101,13 +135,15 @@ try:
             st.caption('Red line is the average. Highlight chart to see average in different times.')
             st.altair_chart(weekly_sum_alt, use_container_width = True)
             st.subheader('Total Message by Sender')
-            col1_7, col1_8 = st.columns(2)
-            col1_7.metric("Message sent by {sender} (n = {sum_msg})".format(sender = sender_daily_agg['sender'][0], sum_msg = sender_daily_agg['sum_msg'][0]), "{pct_msg:.2%}".format(pct_msg = sender_daily_agg['sum_msg'][0] / sum(sender_daily_agg['sum_msg'])))
-            col1_8.metric("Message sent by {sender} (n = {sum_msg})".format(sender = sender_daily_agg['sender'][1], sum_msg = sender_daily_agg['sum_msg'][1]), "{pct_msg:.2%}".format(pct_msg = sender_daily_agg['sum_msg'][1] / sum(sender_daily_agg['sum_msg'])))
+            sender_sum_msg = sender_rows(sender_daily_agg, senders)
+            col1_7 = st.columns(2)
+            for i in range(len(senders)):
+                col1_7[i % 2].metric("Message sent by {sender} (n = {sum_msg})".format(sender = sender_sum_msg['sender'][i], sum_msg = sender_sum_msg['sum_msg'][i]), "{pct_msg:.2%}".format(pct_msg = sender_sum_msg['sum_msg'][i] / sum_msg))
             st.altair_chart(sender_pie)
         
         # Msg sent by day of week
         elif selected_tab == "📅 Message Sent by Day of Week":
+            max_pct_cumsum_dow, days_pareto_dow, highest_avg_dow, lowest_avg_dow, dow_sum_plot, dow_dist_plot = pipeline('max_pct_cumsum_dow', 'days_pareto_dow', 'highest_avg_dow', 'lowest_avg_dow', 'dow_sum_plot', 'dow_dist_plot')
             st.title("Message by Day of Week") 
             st.metric("% of Message sent in Top {len_days_pareto_dow} days (".format(len_days_pareto_dow = len(days_pareto_dow)) + ", ".join(days_pareto_dow) + ")", '{max_pct_cumsum_dow:.2%}'.format(max_pct_cumsum_dow = max_pct_cumsum_dow))
             st.write('Sum message by day of week (0 = Monday, 6 = Sunday)')
@@ -121,6 +157,7 @@ try:
 
         # Msg sent by hour
         elif selected_tab == "⌛ Message Sent by Hour":
+            max_pct_cumsum_hour, cnt_pareto_hour, highest_avg_hour, lowest_avg_hour, peak_hour_list, hour_line, dow_hour_heatmap = pipeline('max_pct_cumsum_hour', 'cnt_pareto_hour', 'highest_avg_hour', 'lowest_avg_hour', 'peak_hour_list', 'hour_line', 'dow_hour_heatmap')
             st.title("Message by Hour")
             col3_1, col3_2 = st.columns(2)
             col3_1.metric("% of Message sent in peak hours ({cnt_pareto_hour} out of 24 hours)".format(cnt_pareto_hour = cnt_pareto_hour), '{max_pct_cumsum_hour:.2%}'.format(max_pct_cumsum_hour = max_pct_cumsum_hour))
@@ -138,6 +175,7 @@ try:
         
         # Msg sent by Month
         elif selected_tab == "🗓️ Message Sent by Month":
+            max_pct_cumsum_month, cnt_pareto_month, len_pareto_month, len_active_month, month_heatmap = pipeline('max_pct_cumsum_month', 'cnt_pareto_month', 'len_pareto_month', 'len_active_month', 'month_heatmap')
             st.title("Message by Month")
             col4_1, col4_2 = st.columns(2)
             col4_1.metric('% of Message sent within {len_pareto_month} out of {len_active_month} active months'.format(len_pareto_month = len_pareto_month, len_active_month = len_active_month), '{max_pct_cumsum_month:.2%}'.format(max_pct_cumsum_month = max_pct_cumsum_month))
@@ -149,6 +187,7 @@ try:
 
         # Gap analysis
         elif selected_tab == "🕒 Gap Analysis":
+            overall_gap_min, overall_gap_sec, weekly_gap_timeseries, gap_agg_sender, gap_difference_note, gap_stat_test_note, gap_xplot_plot, sender_1_name, sender_2_name, both_fast, sender_1_fast, sender_2_fast, both_slow, reply_heatmap = pipeline('overall_gap_min', 'overall_gap_sec', 'weekly_gap_timeseries', 'gap_agg_sender', 'gap_difference_note', 'gap_stat_test_note', 'gap_xplot_plot', 'sender_1_name', 'sender_2_name', 'both_fast', 'sender_1_fast', 'sender_2_fast', 'both_slow', 'reply_heatmap')
             st.title("Analysis of Gap Between Message")
             st.metric('Typical time gap between senders', '{overall_gap_min:.0f}m {overall_gap_sec:.0f}s'.format(overall_gap_min = overall_gap_min, overall_gap_sec = overall_gap_sec))
             st.write('Weekly Median Gap between senders (in seconds)')
@@ -165,32 +204,39 @@ try:
             st.write('* {sender_1_name} responds quickly in the following hours: '.format(sender_1_name = sender_1_name) + ', '.join(str(hour) for hour in sender_1_fast))
             st.write('* {sender_2_name} responds quickly in the following hours: '.format(sender_2_name = sender_2_name) + ', '.join(str(hour) for hour in sender_2_fast))
             st.write('* Both senders respond slowly in the following hours: ' + ', '.join(str(hour) for hour in both_slow))
+            st.subheader('Who replies to whom')
+            st.caption('Color scale represents the number of replies, hover to see the median gap (in seconds)')
+            st.altair_chart(reply_heatmap, use_container_width = True)
         
         # Emoji analysis
         elif selected_tab == "💗 Most Favorite Emoji":
             st.title("Emoji Analysis")
             try:
+                top_emoji, emoji_bar = pipeline('top_emoji', 'emoji_bar')
                 st.metric('Most used emoji', top_emoji)
                 st.write('Top 10 Emoji')
                 st.caption('Number denotes the total emoji sent by all users')
                 st.altair_chart(emoji_bar, use_container_width = True)
                 st.subheader('❤️ Emoji Per Day')
                 try:
+                    love_daily_avg, love_difference_note, love_stat_test_note = pipeline('love_daily_avg', 'love_difference_note', 'love_stat_test_note')
                     st.table(love_daily_avg)
                     st.write('* ' + love_difference_note)
                     st.write('* ' + love_stat_test_note)
                 except:
                     st.write('No ❤️ emoji detected. Send more love to each other!')
                 st.subheader('Top Emoji by Sender & Month')
+                fav_emoji_df, sender_1_first_month, sender_2_first_month, emoji_1_first_month, emoji_2_first_month, sender_1_last_month, sender_2_last_month, emoji_1_last_month, emoji_2_last_month = pipeline('fav_emoji_df', 'sender_1_first_month', 'sender_2_first_month', 'emoji_1_first_month', 'emoji_2_first_month', 'sender_1_last_month', 'sender_2_last_month', 'emoji_1_last_month', 'emoji_2_last_month')
                 col6_1, col6_2 = st.columns(2)
                 col6_1.metric("{sender_1_first_month}'s favorite emoji in the first month".format(sender_1_first_month = sender_1_first_month), emoji_1_first_month)
                 col6_1.metric("{sender_1_last_month}'s favorite emoji in the last month".format(sender_1_last_month = sender_1_last_month), emoji_1_last_month)
                 col6_2.metric("{sender_2_first_month}'s favorite emoji in the first month".format(sender_2_first_month = sender_2_first_month), emoji_2_first_month)
                 col6_2.metric("{sender_2_last_month}'s favorite emoji in the last month".format(sender_2_last_month = sender_2_last_month), emoji_2_last_month)
+                fav_emoji_months = fav_emoji_df['month'].unique()
                 st.write('First three months')
-                st.table(fav_emoji_df.head(6))
+                st.table(fav_emoji_df[fav_emoji_df['month'].isin(fav_emoji_months[:3])])
                 st.write('Last three months')
-                st.table(fav_emoji_df.tail(6))
+                st.table(fav_emoji_df[fav_emoji_df['month'].isin(fav_emoji_months[-3:])])
             except Exception as e:
                 st.write(e)
                 st.write('No emoji were detected in the messages')
@@ -198,6 +244,7 @@ try:
         # Link analysis
         elif selected_tab == "🔗 Most Shared Link":
             try:
+                top_domain, link_overall_bar, domain_avg, link_difference_note, link_stat_test_note, link_sender_bar = pipeline('top_domain', 'link_overall_bar', 'domain_avg', 'link_difference_note', 'link_stat_test_note', 'link_sender_bar')
                 st.title('Shared Link Analysis')
                 st.metric("Most shared domain", top_domain)
                 st.altair_chart(link_overall_bar, use_container_width = True)
@@ -206,9 +253,7 @@ try:
                 st.write('* ' + link_difference_note)
                 st.write('* ' + link_stat_test_note)
                 st.subheader('Top domains of shared links by sender')
-                col7_1, col7_2 = st.columns(2)
-                col7_1.altair_chart(link_sender_bar[0])
-                col7_2.altair_chart(link_sender_bar[1])
+                st.altair_chart(link_sender_bar)
             except Exception as e:
                 st.write(e)
                 st.write('No links were detected in the messages')
@@ -0,0 +1,298 @@
+# -*- coding: utf-8 -*-
+"""
+In-process cache of the helper pipeline.
+
+Replaces st.experimental_singleton, which keeps the chat_df, aggregates and
+charts of every upload in memory forever. Results of every decorated
+function share one memory budget, with sizes estimated from
+memory_usage(deep=True) of the frames they hold. Least recently used
+entries go first when the budget is exceeded, and entries unused for
+longer than the TTL are dropped. The last result larger than the whole
+budget is kept outside of it, until another one replaces it, so reruns
+don't rebuild it.
+
+Frames returned by cached functions are fingerprinted with the key they
+were computed under, e.g. read_chat_txt's chat_df with the hash of the
+upload. Passing them on to another cached function hashes that
+fingerprint instead of the frame, so a rerun costs O(1) per step however
+large the chat. Cached frames must therefore never be modified in place.
+Uploads are hashed once too, their digest is remembered by Streamlit
+file_id, as a rerun hands over a new UploadedFile of the same upload.
+"""
+import functools
+import hashlib
+import os
+import sys
+import threading
+import time
+import weakref
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+MEMORY_BUDGET = int(os.environ.get('WA_VIZ_MEMORY_BUDGET', 512 * 1024 ** 2))
+# seconds an entry is kept without being used
+TTL = float(os.environ.get('WA_VIZ_CACHE_TTL', 60 * 60))
+
+MISSING = object()
+
+# id of a cached result -> (weak reference to it, fingerprint)
+FINGERPRINTS = {}
+# (file_id, size) of an uploaded file -> digest of its content
+UPLOAD_DIGESTS = OrderedDict()
+MAX_UPLOADS = 256
+
+
+def hash_frame(frame, digest):
+    if isinstance(frame, pd.DataFrame):
+        digest.update(repr((tuple(frame.columns), tuple(map(str, frame.dtypes)))).encode())
+        for _, column in frame.items():
+            hash_frame(column, digest)
+        hash_frame(frame.index, digest)
+        return
+
+    try:
+        hashed = pd.util.hash_pandas_object(frame, index=False)
+    except TypeError:
+        # object columns of lists, e.g. emoji & domain
+        hashed = pd.util.hash_pandas_object(frame.map(tuple), index=False)
+    digest.update(str(frame.dtype).encode())
+    digest.update(hashed.to_numpy().tobytes())
+
+
+def set_fingerprint(value, fingerprint):
+    if get_fingerprint(value) is not None:
+        return
+
+    key = id(value)
+
+    def forget(ref):
+        if FINGERPRINTS.get(key, (None,))[0] is ref:
+            del FINGERPRINTS[key]
+
+    try:
+        ref = weakref.ref(value, forget)
+    except TypeError:
+        # str, numbers, tuples... are hashed by value
+        return
+    FINGERPRINTS[key] = (ref, fingerprint)
+
+
+def get_fingerprint(value):
+    entry = FINGERPRINTS.get(id(value))
+    if entry is None or entry[0]() is not value:
+        return None
+    return entry[1]
+
+
+def upload_digest(upload):
+    """
+    Digest of the content of an uploaded file, hashed once per upload.
+    """
+    # UploadedFile's size, so a known upload's buffer isn't touched
+    key = (getattr(upload, 'file_id', None), getattr(upload, 'size', None))
+    if key in UPLOAD_DIGESTS:
+        return UPLOAD_DIGESTS[key]
+
+    with upload.getbuffer() as buffer:
+        fingerprint = "upload:" + hashlib.blake2b(buffer, digest_size=20).hexdigest()
+    # the same upload object is recognized without a file_id
+    set_fingerprint(upload, fingerprint)
+    if key[0] is not None:
+        UPLOAD_DIGESTS[key] = fingerprint
+        while len(UPLOAD_DIGESTS) > MAX_UPLOADS:
+            UPLOAD_DIGESTS.popitem(last=False)
+    return fingerprint
+
+
+def hash_value(value, digest):
+    fingerprint = get_fingerprint(value)
+    if fingerprint is not None:
+        digest.update(fingerprint.encode())
+    elif isinstance(value, (pd.DataFrame, pd.Series, pd.Index)):
+        hash_frame(value, digest)
+    elif hasattr(value, 'getbuffer'):
+        # uploaded file
+        digest.update(upload_digest(value).encode())
+    elif isinstance(value, (tuple, list)):
+        digest.update("{}{}".format(type(value).__name__, len(value)).encode())
+        for item in value:
+            hash_value(item, digest)
+    else:
+        digest.update(repr(value).encode())
+
+
+def cache_key(func, args, kwargs):
+    digest = hashlib.blake2b(digest_size=20)
+    hash_value(args, digest)
+    hash_value(sorted(kwargs.items()), digest)
+    return func.__module__, func.__qualname__, digest.hexdigest()
+
+
+def fingerprint_result(key, value):
+    _, name, digest = key
+    fingerprint = "{}:{}".format(name, digest)
+    if isinstance(value, tuple):
+        for i, item in enumerate(value):
+            set_fingerprint(item, "{}:{}".format(fingerprint, i))
+    else:
+        set_fingerprint(value, fingerprint)
+
+
+def estimate_size(value, seen=None):
+    """
+    Estimated bytes held by value: memory_usage(deep=True) of frames,
+    nbytes of arrays and cubes, the data of altair charts, counted once
+    when shared between layers.
+    """
+    if seen is None:
+        seen = set()
+    if id(value) in seen:
+        return 0
+    seen.add(id(value))
+
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    if isinstance(value, (pd.Series, pd.Index)):
+        return int(value.memory_usage(deep=True))
+    if isinstance(value, (tuple, list)):
+        return sys.getsizeof(value) + sum(estimate_size(item, seen) for item in value)
+
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+
+    size = sys.getsizeof(value)
+    # activity cubes report the bytes of their arrays
+    size += getattr(value, 'nbytes', 0)
+    # altair charts hold their data, layered charts their layers
+    data = getattr(value, 'data', None)
+    if isinstance(data, pd.DataFrame):
+        size += estimate_size(data, seen)
+    layers = getattr(value, 'layer', None)
+    if isinstance(layers, list):
+        size += estimate_size(layers, seen)
+
+    return size
+
+
+class MemoryCache:
+    """
+    LRU cache of at most max_bytes, entries expiring after ttl seconds
+    unused. The last entry larger than max_bytes is pinned outside of the
+    budget:
+
+    >>> cache = MemoryCache(max_bytes=1000)
+    >>> cache.put('chat_df', np.zeros(1000))
+    >>> cache.put('cube', np.zeros(10))
+    >>> cache.get('chat_df') is MISSING, cache.get('cube') is MISSING
+    (False, False)
+    """
+
+    def __init__(self, max_bytes=MEMORY_BUDGET, ttl=TTL):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        # key -> (value, nbytes, last used), least recently used first
+        self.entries = OrderedDict()
+        # bytes of the entries but the pinned one
+        self.nbytes = 0
+        # key of the last result larger than max_bytes
+        self.pinned = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.oversize = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=MISSING):
+        now = time.monotonic()
+        with self.lock:
+            self.expire(now)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            self.hits += 1
+            value, nbytes, _ = entry
+            self.entries[key] = (value, nbytes, now)
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        nbytes = estimate_size(value)
+        with self.lock:
+            self.discard(key)
+            self.entries[key] = (value, nbytes, time.monotonic())
+            if nbytes > self.max_bytes:
+                self.oversize += 1
+                if self.pinned is not None:
+                    self.evict(self.pinned)
+                self.pinned = key
+                return
+
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                self.evict(next(k for k in self.entries if k != self.pinned))
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        if key == self.pinned:
+            self.pinned = None
+        else:
+            self.nbytes -= entry[1]
+
+    def evict(self, key):
+        self.discard(key)
+        self.evictions += 1
+
+    def expire(self, now):
+        # entries are ordered by last use, so expired ones are at the front
+        while self.entries:
+            key, (_, _, last_used) = next(iter(self.entries.items()))
+            if now - last_used <= self.ttl:
+                break
+            self.evict(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+            self.pinned = None
+
+    def stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.nbytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'oversize': self.oversize,
+                'pinned_bytes': self.entries[self.pinned][1] if self.pinned is not None else 0,
+            }
+
+
+PIPELINE_CACHE = MemoryCache()
+
+
+def cached(func):
+    """
+    Cache the results of func in PIPELINE_CACHE, keyed by a hash of its
+    arguments, or their fingerprints. Results are shared between sessions, like
+    st.experimental_singleton.
+    """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        key = cache_key(func, args, kwargs)
+        value = PIPELINE_CACHE.get(key)
+        if value is MISSING:
+            # computed outside the lock, so sessions don't wait on each other
+            value = func(*args, **kwargs)
+            fingerprint_result(key, value)
+            PIPELINE_CACHE.put(key, value)
+        return value
+
+    return wrapper
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""
+Multi-process parsing of large exports.
+
+The lines are streamed into shards of SHARD_LINES cut at starting lines,
+so a multiline message is never cut and every shard parses without the
+context of the one before it. Shards are parsed in a process pool, a few
+per worker in flight so the export is never held in memory whole, and
+their columns concatenated in order. Workers get a copy of the language
+classifier, so when one switches to every language, the shards sent after
+it are parsed again switched, as a serial parse would have.
+"""
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import classifier
+import columnar
+from chatline import FEATURES, parse_chatlines
+
+# exports smaller than this are parsed serially, the pool costs more
+PARALLEL_MIN_BYTES = 32 * 1024 * 1024
+# lines per shard
+SHARD_LINES = 50_000
+# shards in flight per worker, so a slow shard doesn't hold the others back
+SHARDS_PER_WORKER = 4
+# fork would copy the locks other threads of the Streamlit server hold
+MP_CONTEXT = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def worker_count(workers=None):
+    """
+    Number of parsing processes, one per CPU if workers is None.
+    """
+    return workers or os.cpu_count() or 1
+
+
+def parse_shard(lines, timestamp_format, engine, features, line_classifier, keep_body):
+    """
+    Columns of lines, and whether line_classifier switched to every
+    language.
+    """
+    if engine == 'columnar':
+        message = columnar.parse_lines(lines, timestamp_format, features, line_classifier, keep_body)
+    else:
+        message = parse_chatlines(lines, timestamp_format, features, line_classifier, keep_body)
+    return message, getattr(line_classifier, 'fallback', False)
+
+
+def parse_lines(lines, timestamp_format, engine='python', workers=None, features=FEATURES, line_classifier=classifier.FULL, keep_body=None):
+    """
+    Parse an iterable of lines in a pool of workers processes, one per CPU
+    if None. Returns the same columns as the serial engine.
+    """
+    workers = worker_count(workers)
+    shards = columnar.iter_batches(lines, SHARD_LINES)
+    # (lines, future) of the shards sent, in order
+    pending = deque()
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(MP_CONTEXT)) as pool:
+        def send(shard):
+            pending.append((shard, pool.submit(parse_shard, shard, timestamp_format, engine, features, line_classifier, keep_body)))
+
+        def receive():
+            _, future = pending.popleft()
+            message, fell_back = future.result()
+            results.append(message)
+            if fell_back and not getattr(line_classifier, 'fallback', False):
+                # shards sent before the switch are parsed again switched
+                line_classifier.use_full_set()
+                sent = []
+                while pending:
+                    shard, future = pending.popleft()
+                    future.cancel()
+                    sent.append(shard)
+                for shard in sent:
+                    send(shard)
+
+        for shard in shards:
+            send(shard)
+            if len(pending) >= workers * SHARDS_PER_WORKER:
+                receive()
+        while pending:
+            receive()
+
+    if not results:
+        return parse_shard([], timestamp_format, engine, features, line_classifier, keep_body)[0]
+    return columnar.concat_columns(results)
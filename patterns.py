@@ -29,57 +29,110 @@ IS_CHAT = r"""
     (.+)  #One or more charachter of message content
 """
 
-IS_DELETED_CHAT = [
-    r".*This message was deleted$",
-    r".*Pesan ini telah dihapus$"
-]
+# Attachment, deleted message & event patterns, one pack per export language,
+# so an export only gets tested against the languages it's written in
+# (see classifier.detect_locales).
+# Every attachment & deleted pattern of a pack must contain one of the pack's
+# literal keywords, they are used by classifier.py to skip the regex for
+# plain messages.
+LOCALES = {
+    'en': {
+        'deleted': [
+            r".*This message was deleted$",
+        ],
+        'attachment': [
+            r".*<Media omitted>$", #English version of android attachment
+            r".+\.vcf \(file\sattached\)$", #English version of android contact card,
+            r".*image omitted$",
+            r".*video omitted$",
+            r".*document omitted$",
+            r".*Contact card omitted$",
+            r".*audio omitted$",
+            r".*GIF omitted$",
+            r".*sticker omitted$",
+        ],
+        'event': [
+            # Welcoming message
+            r"Messages to this group are now secured with end-to-end encryption\.$",
+            # User created group
+            r".+\screated this group$",
+            # User left group
+            r".+\sleft$",
+            # User join group via inviation link
+            r".+\sjoined using this group's invite link$",
+            # Admin adds member
+            r".+\sadded\s.+",
+            # Admin removes member
+            r".+\sremoved\s.+",
+            # Member's security code changed
+            r".+'s security code changed\.$",
+            # Member changes phone number
+            r".*changed their phone number to a new number. Tap to message or add the new number\.$",
+        ],
+        'keywords': [
+            "deleted",
+            "omitted", # <Media omitted>, image omitted, ...
+            ".vcf",
+        ],
+    },
+    'id': {
+        'deleted': [
+            r".*Pesan ini telah dihapus$",
+        ],
+        'attachment': [
+            r".*<Media tidak disertakan>$", #Indonesia version of android attachment
+            r".*Pesan tidak didukung$", #Some device not recognize sticker attachment
+            r".+\.vcf \(file\sterlampir\)$", #Indonesian version of android contact card,
+        ],
+        'event': [
+            # User left group
+            r".+\skeluar$",
+            # User join group via inviation link
+            r".+\stelah bergabung menggunakan tautan undangan grup ini$",
+            # Admin adds member
+            r".+\smenambahkan\s.+",
+            # Member changes phone number
+            r".*telah mengganti nomor teleponnya ke nomor baru. Ketuk untuk mengirim pesan atau menambahkan nomor baru\.$",
+        ],
+        'keywords': [
+            "dihapus",
+            "Media",
+            "didukung",
+            ".vcf",
+        ],
+    },
+    'es': {
+        'deleted': [],
+        'attachment': [
+            r".*Archivo omitido*", #Spanish version of android attachment
+            r".*imagen omitida*",
+            r".*audio omitido*",
+            r".*GIF omitido*",
+            r".*sticker omitido*",
+            r".*video omitido*",
+        ],
+        'event': [],
+        'keywords': [
+            "omitid", # omitido, omitida
+        ],
+    },
+    'it': {
+        'deleted': [],
+        'attachment': [
+            r".*<Media omessi>$", #Italian version of android attachment
+        ],
+        'event': [],
+        'keywords': [
+            "Media",
+        ],
+    },
+}
 
-IS_ATTACHMENT = [
-    r".*<Media omitted>$", #English version of android attachment
-    r".*<Media tidak disertakan>$", #Indonesia version of android attachment
-    r".*Archivo omitido*", #Spanish version of android attachment
-    r".*<Media omessi>$", #Italian version of android attachment
-    r".*Pesan tidak didukung$", #Some device not recognize sticker attachment
-    r".+\.vcf \(file\sterlampir\)$", #Indonesian version of android contact card,
-    r".+\.vcf \(file\sattached\)$", #Indonesian version of android contact card,
-    r".*image omitted$",
-    r".*video omitted$",
-    r".*document omitted$",
-    r".*Contact card omitted$",
-    r".*audio omitted$",
-    r".*GIF omitted$",
-    r".*sticker omitted$",
-    r".*imagen omitida*",
-    r".*audio omitido*",
-    r".*GIF omitido*",
-    r".*sticker omitido*",
-    r".*video omitido*",
-]
+# Full sets, every language
+IS_DELETED_CHAT = [p for locale in LOCALES.values() for p in locale['deleted']]
+IS_ATTACHMENT = [p for locale in LOCALES.values() for p in locale['attachment']]
+IS_EVENT = [p for locale in LOCALES.values() for p in locale['event']]
+MESSAGE_KEYWORDS = sorted({k for locale in LOCALES.values() for k in locale['keywords']})
 
 
 IS_URL = r"(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,6}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:'\".,<>?«»“”‘’]))"
-
-IS_EVENT = [
-    # Welcoming message
-    r"Messages to this group are now secured with end-to-end encryption\.$",  # EN
-    # User created group
-    r".+\screated this group$",  # EN
-    # User left group
-    r".+\sleft$",  # EN
-    r".+\skeluar$",  # ID
-    # User join group via inviation link
-    r".+\sjoined using this group's invite link$",  # EN
-    r".+\stelah bergabung menggunakan tautan undangan grup ini$",  # ID
-    # Admin adds member
-    r".+\sadded\s.+",  # EN
-    r".+\smenambahkan\s.+",  # ID
-    # Admin removes member
-    r".+\sremoved\s.+",  # EN
-    # Member's security code changed
-    r".+'s security code changed\.$",  # EN
-    # Member changes phone number
-    r".*changed their phone number to a new number. Tap to message or add the new number\.$"  # EN
-    r".*telah mengganti nomor teleponnya ke nomor baru. Ketuk untuk mengirim pesan atau menambahkan nomor baru\.$",  # ID
-]
-
-
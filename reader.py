@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""
+Streaming line reader for uploaded exports.
+
+The uploaded file is read in fixed-size chunks through an incremental
+decoder, so the raw bytes, the decoded text and the list of lines never
+have to sit in memory together. The codec is picked from the BOM, or
+sniffed from the first chunk for exports written without one.
+"""
+import codecs
+
+CHUNK_SIZE = 1 << 20
+SNIFF_SIZE = 4096
+
+# characters str.splitlines breaks on
+LINE_BREAKS = "\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029"
+
+BOMS = [
+    (codecs.BOM_UTF32_LE, 'utf-32'),
+    (codecs.BOM_UTF32_BE, 'utf-32'),
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+]
+
+
+def sniff_encoding(head=b""):
+    """
+    Pick the codec of an export from its first bytes.
+    BOM first, then NUL bytes for UTF-16 without BOM (every other byte of
+    an ASCII timestamp is NUL), then UTF-8, then latin-1 which never fails.
+    """
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+
+    sample = head[:SNIFF_SIZE]
+    if sample.count(b"\x00") > len(sample) // 4:
+        if sample[1::2].count(b"\x00") > sample[0::2].count(b"\x00"):
+            return 'utf-16-le'
+        return 'utf-16-be'
+
+    try:
+        # a multibyte character may be cut at the end of the sample
+        codecs.getincrementaldecoder('utf-8')().decode(sample)
+        return 'utf-8'
+    except UnicodeDecodeError:
+        return 'latin-1'
+
+
+def iter_lines(file_obj, chunk_size=CHUNK_SIZE):
+    """
+    Yield the lines of file_obj without line breaks, same as
+    decode().splitlines(). A partial line at the end of a chunk is carried
+    over to the next one.
+    """
+    file_obj.seek(0)
+    # the first chunk is also the sniffing sample
+    chunk = file_obj.read(max(chunk_size, SNIFF_SIZE))
+    decoder = codecs.getincrementaldecoder(sniff_encoding(chunk))(errors='replace')
+
+    pending = ""
+    while chunk:
+        text = pending + decoder.decode(chunk)
+        pending = ""
+
+        lines = text.splitlines()
+        # keep the last line if it's not terminated yet, or ends with
+        # '\r' whose '\n' may come with the next chunk
+        if text and text[-1] not in LINE_BREAKS:
+            pending = lines.pop()
+        elif text.endswith("\r"):
+            pending = lines.pop() + "\r"
+
+        yield from lines
+        chunk = file_obj.read(chunk_size)
+
+    yield from (pending + decoder.decode(b"", final=True)).splitlines()
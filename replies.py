@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""
+Who replies to whom: sender × sender matrices of reply counts and median
+reply latency.
+
+Every turn of gap_aggregation is a reply of its sender to the sender of
+the previous turn, so both matrices come from one pass over consecutive
+sender codes. They are scipy.sparse CSR matrices: a group of 1000 members
+has a million sender pairs, only the pairs that replied to each other are
+stored.
+"""
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+class ReplyGraph:
+    """
+    counts[sender, replied_to] and median_latency[sender, replied_to] in
+    seconds, indexed by the codes of senders.
+    """
+    __slots__ = ('counts', 'median_latency', 'senders', '__weakref__')
+
+    def __init__(self, counts, median_latency, senders):
+        self.counts = counts
+        self.median_latency = median_latency
+        self.senders = senders
+
+    @classmethod
+    def from_turns(cls, sender, time_delta):
+        """
+        From the turns of a chat: their categorical sender and the seconds
+        since the previous turn.
+        """
+        sender = pd.Categorical(sender)
+        n_senders = len(sender.categories)
+        replied_to = sender.codes[:-1].astype(np.int64)
+        replier = sender.codes[1:].astype(np.int64)
+        latency = np.asarray(time_delta, dtype=np.float64)[1:]
+
+        # duplicate pairs are summed by the COO -> CSR conversion
+        counts = sparse.coo_matrix(
+            (np.ones(len(replier), dtype=np.int64), (replier, replied_to)),
+            shape=(n_senders, n_senders),
+        ).tocsr()
+
+        # one pair id per reply, medians only for the pairs that occur
+        median = pd.Series(latency).groupby(replier * n_senders + replied_to).median()
+        pair = median.index.to_numpy()
+        median_latency = sparse.csr_matrix(
+            (median.to_numpy(), (pair // n_senders, pair % n_senders)),
+            shape=(n_senders, n_senders),
+        )
+
+        return cls(counts, median_latency, sender.categories)
+
+    def __repr__(self):
+        return "ReplyGraph(senders={}, pairs={})".format(len(self.senders), self.counts.nnz)
+
+    @property
+    def nbytes(self):
+        return sum(matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes for matrix in (self.counts, self.median_latency))
+
+    def frame(self, senders):
+        """
+        One row per pair of the given senders that replied to each other:
+        sender, replied_to, cnt_reply and median_delta_sec.
+        """
+        index = self.senders.get_indexer(senders)
+        index = index[index >= 0]
+        counts = self.counts[index][:, index].tocoo()
+        median_latency = self.median_latency[index][:, index]
+
+        name = np.asarray(self.senders[index], dtype=object)
+        return pd.DataFrame({
+            'sender': name[counts.row],
+            'replied_to': name[counts.col],
+            'cnt_reply': counts.data,
+            'median_delta_sec': np.asarray(median_latency[counts.row, counts.col]).ravel(),
+        })
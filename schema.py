@@ -0,0 +1,48 @@
+# -*- coding: utf-8 -*-
+"""
+Compact dtypes of chat_df.
+
+A handful of senders and months repeat over millions of rows, so they are
+stored as categoricals, one small integer code per row. Calendar fields
+fit in int8 and timestamps in datetime64[ns], a plain int64 per row.
+"""
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+DTYPES = {
+    'timestamp': 'datetime64[ns]',
+    'sender': 'category',
+    'month': 'category',
+    'day': 'int8',
+    'dow': 'int8',
+    'hour': 'int8',
+}
+
+
+def compact(chat_df):
+    return chat_df.astype({column: dtype for column, dtype in DTYPES.items() if column in chat_df})
+
+
+def concat(frames):
+    """
+    Rows of compact frames one after the other, categoricals staying
+    categorical with the union of their categories.
+    """
+    chat_df = pd.concat(frames, ignore_index=True)
+    for column, dtype in DTYPES.items():
+        if dtype == 'category' and column in chat_df:
+            chat_df[column] = union_categoricals([frame[column] for frame in frames], sort_categories=True)
+    return chat_df
+
+
+def memory_report(chat_df):
+    """
+    Bytes per column of chat_df before and after compact.
+    """
+    report = pd.DataFrame({
+        'before': chat_df.memory_usage(deep=True, index=False),
+        'after': compact(chat_df).memory_usage(deep=True, index=False),
+    })
+    report.loc['total'] = report.sum()
+    report['ratio'] = report['after'] / report['before']
+    return report
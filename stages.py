@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""
+Dependency graph of the dashboard's pipeline stages.
+
+A stage is a function from named values to named values, e.g.
+dow_aggregation from 'cube' to 'sum_dow', 'days_pareto_dow', ... Tabs ask
+the Pipeline for the values they display and only the stages those need
+run, each at most once per dataset: values are kept in st.session_state
+until the upload, period or shown senders change.
+"""
+from collections import namedtuple
+
+Stage = namedtuple('Stage', ['outputs', 'func', 'inputs'])
+
+SESSION_KEY = 'stage_values'
+
+
+def session_values(session_state, dataset):
+    """
+    Values computed for dataset in this session. Those of the previous
+    dataset are dropped.
+    """
+    memo = session_state.get(SESSION_KEY)
+    if memo is None or memo[0] != dataset:
+        memo = (dataset, {})
+        session_state[SESSION_KEY] = memo
+    return memo[1]
+
+
+class Pipeline:
+    """
+    Values of stages, computed on demand from the stages they depend on.
+    """
+
+    def __init__(self, stages, values):
+        self.producers = {output: stage for stage in stages for output in stage.outputs}
+        self.values = values
+
+    def run(self, stage):
+        result = stage.func(*[self.get(name) for name in stage.inputs])
+        if len(stage.outputs) == 1:
+            result = (result,)
+        self.values.update(zip(stage.outputs, result))
+
+    def get(self, name):
+        if name not in self.values:
+            if name not in self.producers:
+                raise KeyError("no stage computes {}".format(name))
+            self.run(self.producers[name])
+        return self.values[name]
+
+    def __call__(self, *names):
+        """
+        Values of names, a tuple if there are several.
+        """
+        values = tuple(self.get(name) for name in names)
+        return values if len(values) > 1 else values[0]
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""
+Time index of chat_df: its timestamps sorted once, so the messages of any
+period are found with two binary searches (np.searchsorted) instead of a
+mask over every message.
+
+Periods remember the chat_df they were cut from (parent_of), so features
+extracted once for the whole chat are sliced instead of extracted again.
+"""
+import weakref
+import numpy as np
+
+DAY = np.timedelta64(1, 'D')
+
+# id of a period -> (weakref to the chat_df it was cut from, its rows there)
+PARENTS = {}
+
+
+class TimeIndex:
+    """
+    Sorted timestamps of chat_df, and the row of each when chat_df is not
+    in chronological order (order is None otherwise).
+    """
+    __slots__ = ('timestamp', 'order', '__weakref__')
+
+    def __init__(self, timestamp, order):
+        self.timestamp = timestamp
+        self.order = order
+
+    @classmethod
+    def from_chat_df(cls, chat_df):
+        timestamp = chat_df['timestamp'].to_numpy(dtype='datetime64[ns]')
+        # exports are chronological, unless a clock change moved messages back
+        if (np.diff(timestamp) < np.timedelta64(0)).any():
+            order = np.argsort(timestamp, kind='stable')
+            return cls(timestamp[order], order)
+        return cls(timestamp, None)
+
+    def __repr__(self):
+        return "TimeIndex(messages={}, sorted={})".format(len(self.timestamp), self.order is None)
+
+    def dates(self):
+        """
+        Dates of the first and last message.
+        """
+        return tuple(self.timestamp[[0, -1]].astype('datetime64[D]').tolist())
+
+    def bounds(self, start, end):
+        """
+        Positions in the sorted timestamps of the messages from date start
+        to date end included.
+        """
+        start = np.datetime64(start, 'D').astype('datetime64[ns]')
+        end = (np.datetime64(end, 'D') + DAY).astype('datetime64[ns]')
+        return np.searchsorted(self.timestamp, start), np.searchsorted(self.timestamp, end)
+
+    def rows(self, start, end):
+        lo, hi = self.bounds(start, end)
+        if self.order is None:
+            return slice(lo, hi)
+        return self.order[lo:hi]
+
+    def take(self, chat_df, start, end):
+        """
+        Messages of chat_df from date start to date end included, chat_df
+        itself if that's all of them.
+        """
+        lo, hi = self.bounds(start, end)
+        if hi - lo == len(chat_df):
+            return chat_df
+
+        rows = self.rows(start, end)
+        period = chat_df.iloc[rows].reset_index(drop=True)
+        PARENTS[id(period)] = (weakref.ref(chat_df), rows)
+        weakref.finalize(period, PARENTS.pop, id(period), None)
+        return period
+
+
+def parent_of(period):
+    """
+    The chat_df period was cut from, if it is still alive, and the rows of
+    period there. (None, None) otherwise.
+    """
+    parent, rows = PARENTS.get(id(period), (None, None))
+    if parent is None or parent() is None:
+        return None, None
+    return parent(), rows
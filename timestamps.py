@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+"""
+Export timestamp format detection.
+
+WhatsApp writes every timestamp of an export in the same format, which
+depends on the phone's locale: DD/MM or MM/DD, 2 or 4 digit year, 12 or 24
+hour clock, with or without seconds. Only the order of day and month can't
+be read from a single timestamp, it is detected once from the first
+starting lines. Timestamps are then built straight from the
+IS_STARTING_LINE groups instead of calling dateutil on every line.
+"""
+from datetime import datetime
+from itertools import islice
+from dateutil import parser
+import pandas as pd
+import classifier
+
+# lines read at most to find a date telling day and month apart
+MAX_SCAN_LINES = 50_000
+
+# IS_STARTING_LINE group numbers
+DATETIME = 2
+DATE_FIRST = 4
+DATE_SECOND = 6
+YEAR = 8
+HOUR = 11
+MINUTE = 13
+SECOND = 15
+AMPM = 16
+
+
+class TimestampFormat:
+
+    def __init__(self, dayfirst=False):
+        self.dayfirst = dayfirst
+
+    def __repr__(self):
+        return "TimestampFormat(dayfirst={})".format(self.dayfirst)
+
+    def from_match(self, starting_line):
+        """
+        Build the timestamp from the groups of an IS_STARTING_LINE match.
+        Fall back to dateutil if the groups don't fit the detected format.
+        """
+        first = int(starting_line.group(DATE_FIRST))
+        second = int(starting_line.group(DATE_SECOND))
+        day, month = (first, second) if self.dayfirst else (second, first)
+
+        year = int(starting_line.group(YEAR))
+        if year < 100:
+            year += 2000
+
+        hour = int(starting_line.group(HOUR))
+        ampm = starting_line.group(AMPM)
+        if ampm:
+            is_pm = ampm.strip()[0] in "pP"
+            if hour == 12:
+                hour = 12 if is_pm else 0
+            elif is_pm:
+                hour += 12
+
+        sec = starting_line.group(SECOND)
+
+        try:
+            return datetime(year, month, day, hour, int(starting_line.group(MINUTE)), int(sec) if sec else 0)
+        except ValueError:
+            return parser.parse(starting_line.group(DATETIME), dayfirst=self.dayfirst)
+
+    def from_groups(self, groups):
+        """
+        Vectorized from_match. groups is the frame returned by
+        str.extract(IS_STARTING_LINE), group n being column n - 1.
+        """
+        first = groups[DATE_FIRST - 1].astype(int)
+        second = groups[DATE_SECOND - 1].astype(int)
+        day, month = (first, second) if self.dayfirst else (second, first)
+
+        year = groups[YEAR - 1].astype(int)
+        year = year.where(year >= 100, year + 2000)
+
+        hour = groups[HOUR - 1].astype(int)
+        ampm = groups[AMPM - 1]
+        if ampm.notna().any():
+            is_pm = ampm.str.strip().str[0].isin(["p", "P"])
+            is_am = ampm.notna() & ~is_pm
+            hour = hour.where(~(is_am & (hour == 12)), 0)
+            hour = hour.where(~(is_pm & (hour != 12)), hour + 12)
+
+        timestamp = pd.to_datetime(pd.DataFrame({
+            'year': year,
+            'month': month,
+            'day': day,
+            'hour': hour,
+            'minute': groups[MINUTE - 1].astype(int),
+            'second': groups[SECOND - 1].fillna(0).astype(int),
+        }), errors='coerce')
+
+        invalid = timestamp.isna()
+        if invalid.any():
+            timestamp[invalid] = groups.loc[invalid, DATETIME - 1].map(
+                lambda x: parser.parse(x, dayfirst=self.dayfirst))
+
+        return timestamp
+
+
+def detect_format(lines, max_lines=MAX_SCAN_LINES):
+    """
+    Detect the timestamp format from the first starting line with a date
+    component above 12: the first one means DD/MM, the second one MM/DD.
+    Dates within the first 12 days of a month are ambiguous, exports
+    without any other date in their first max_lines lines keep dateutil's
+    default (MM/DD).
+    """
+    for line in islice(lines, max_lines):
+        starting_line = classifier.STARTING_LINE.match(classifier.clean_line(line))
+        if not starting_line:
+            continue
+
+        if int(starting_line.group(DATE_FIRST)) > 12:
+            return TimestampFormat(dayfirst=True)
+        if int(starting_line.group(DATE_SECOND)) > 12:
+            return TimestampFormat(dayfirst=False)
+
+    return TimestampFormat(dayfirst=False)
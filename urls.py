@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+URL and domain extraction.
+
+Bodies are first checked for a cheap URL hint, so most messages never get
+scanned. URLs are then found with a linear scanner over whitespace
+separated tokens instead of patterns.IS_URL, whose nested quantifiers can
+backtrack for a very long time on long pasted messages. The scanner finds
+the same URLs: every place IS_URL could start a match is listed without
+backtracking, then tried left to right like re.findall. Domains are
+normalized through a bounded LRU cache, so a domain shared a thousand
+times is resolved once.
+"""
+import re
+from functools import lru_cache
+
+# '://', 'www.' or a dot followed by a TLD-like token and a slash
+URL_HINT = re.compile(r"(?i)://|www\d{0,3}[.]|[.][a-z]{2,6}/")
+# scheme & www starts of patterns.IS_URL, every position they match at
+SCHEME_START = re.compile(r"(?i)\b(?=(https?://|www\d{0,3}[.]))")
+# runs of host characters followed by a slash, for IS_URL's host.tld/ start
+HOST_RUN = re.compile(r"(?i)(?<![a-z0-9.\-])[a-z0-9.\-]++(?=/)")
+TLD = re.compile(r"(?i)[a-z]{2,6}")
+WWW = re.compile(r"(?i)^www\d{0,3}[.]")
+
+# characters that split IS_URL's body into runs & parenthesized groups
+PAREN_STOP_CHARS = "()<>"
+# characters a URL can't end with
+TRAILING_CHARS = "`!()[]{};:'\".,<>?«»“”‘’"
+
+DOMAIN_CACHE_SIZE = 4096
+
+# shared by every body without URL, like chatline.EMPTY
+NO_URL = ()
+
+
+def group_end(token, i):
+    """
+    End of the parenthesized group of IS_URL opening at token[i], None if
+    it doesn't close: runs and non-empty parenthesized runs, e.g. wikipedia
+    links.
+    """
+    i += 1
+    while i < len(token):
+        char = token[i]
+        if char == ")":
+            return i + 1
+        if char == "(":
+            j = i + 1
+            while j < len(token) and token[j] not in PAREN_STOP_CHARS:
+                j += 1
+            if j == i + 1 or j == len(token) or token[j] != ")":
+                return None
+            i = j + 1
+        elif char in PAREN_STOP_CHARS:
+            return None
+        else:
+            i += 1
+
+    return None
+
+
+def url_end(token, start):
+    """
+    End of the URL whose start pattern ends at token[start], start if there
+    is none. IS_URL's body is runs of URL characters and parenthesized
+    groups, ending with a group or a character other than punctuation that
+    follows at least one of them. Read in one pass.
+    """
+    pieces = []
+    i = start
+    while i < len(token):
+        if token[i] == "(":
+            end = group_end(token, i)
+            if end is None:
+                break
+            pieces.append((i, end, True))
+        elif token[i] in PAREN_STOP_CHARS:
+            break
+        else:
+            end = i + 1
+            while end < len(token) and token[end] not in PAREN_STOP_CHARS:
+                end += 1
+            pieces.append((i, end, False))
+        i = end
+
+    # the longest body with a valid end
+    for piece_start, piece_end, is_group in reversed(pieces):
+        if is_group:
+            return piece_end if piece_start > start else start
+        for end in range(piece_end, piece_start, -1):
+            if token[end - 1] not in TRAILING_CHARS:
+                return end if end - 1 > start else start
+
+    return start
+
+
+def is_word(token, i):
+    return 0 <= i < len(token) and (token[i].isalnum() or token[i] == "_")
+
+
+def url_starts(token):
+    """
+    Every (start, alternative, end of the start pattern) IS_URL could
+    match in token, sorted in the order IS_URL tries them.
+    """
+    starts = [(match.start(), 0, match.end(1)) for match in SCHEME_START.finditer(token)]
+
+    # host.tld/: the TLD is what follows the last dot of the run, and any
+    # word boundary before that dot can start the match. A match failing
+    # at one of them fails at all of them (same end), so the first is enough
+    for run in HOST_RUN.finditer(token):
+        dot = run.group().rfind(".")
+        if dot < 1 or not TLD.fullmatch(run.group(), dot + 1):
+            continue
+        for start in range(run.start(), run.start() + dot):
+            if is_word(token, start - 1) != is_word(token, start):
+                starts.append((start, 1, run.end() + 1))
+                break
+
+    return sorted(starts)
+
+
+def extract_urls(body=""):
+    """
+    URLs of body, the same as patterns.IS_URL finds:
+
+    >>> import re, patterns
+    >>> cases = ["www1.(b)", "www1.()", "http://p(_s())", "http://ab(_s())", "http://x()y", "a.www.b.com/c>"]
+    >>> [list(extract_urls(case)) == [m[0] for m in re.findall(patterns.IS_URL, case)] for case in cases]
+    [True, True, True, True, True, True]
+    """
+    if not URL_HINT.search(body):
+        return NO_URL
+
+    urls = []
+    for token in body.split():
+        resume = 0
+        for start, _, start_end in url_starts(token):
+            if start < resume:
+                continue
+            end = url_end(token, start_end)
+            if end > start_end:
+                urls.append(token[start:end])
+                resume = end
+
+    return urls or NO_URL
+
+
+@lru_cache(maxsize=DOMAIN_CACHE_SIZE)
+def normalize_domain(host=""):
+    """
+    Lowercase, without 'www.' and port.
+    """
+    host = host.lower().split(":", 1)[0]
+    return WWW.sub("", host)
+
+
+def get_domain(url=""):
+    host = url.split("://", 1)[-1]
+    for separator in "/?#":
+        host = host.split(separator, 1)[0]
+    return normalize_domain(host)
+
+
+def extract_domains(body=""):
+    return [get_domain(url) for url in extract_urls(body)] or NO_URL